@@ -4,10 +4,10 @@ from __future__ import annotations
 from typing import Dict, List, Optional
 from pydantic import BaseModel
 from pathlib import Path
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from .receptionist import AnalysisResult
-from ..law_guides import LawGuideEngine
+from ..law_guides import get_engine
 from ..prompts import INFO_SYSTEM_PROMPT, PROFESSIONAL_SYSTEM_PROMPT
 
 
@@ -36,9 +36,10 @@ class LawyerAgent:
     
     def __init__(self):
         self.client = self._init_openai_client()
+        self.async_client = AsyncOpenAI(api_key=self.client.api_key) if self.client else None
         self.model = "gpt-5-mini"
         try:
-            self.law_guide_engine = LawGuideEngine()
+            self.law_guide_engine = get_engine()
         except Exception as exc:
             print(f"[Lawyer] Warning: failed to load law guides: {exc}")
             self.law_guide_engine = None
@@ -129,13 +130,73 @@ class LawyerAgent:
             retry_feedback: 重試時的反饋（如果有）
         """
         if not self.client:
-            return LawyerResponse(
-                answer="抱歉，系統暫時無法生成答案（API未配置）",
-                confidence=0.0,
-                used_citations=[],
-                uncertainties=["系統配置問題"]
+            return self._unavailable_response()
+        
+        messages, strategy = self._prepare_messages(query, analysis, citations, retry_feedback)
+        
+        # 4. 調用 LLM 生成答案
+        try:
+            answer = self._invoke_llm(
+                messages=messages,
+                temperature=strategy["temperature"],
+                max_tokens=strategy["max_output_tokens"]
+            )
+        except Exception as e:
+            return self._failed_response(e)
+        
+        return self._finalize(answer, citations)
+    
+    async def agenerate_answer(
+        self,
+        query: str,
+        analysis: AnalysisResult,
+        citations: List[Dict],
+        retry_feedback: Optional[str] = None
+    ) -> LawyerResponse:
+        """生成答案（非同步版本，使用 AsyncOpenAI）"""
+        if not self.async_client:
+            return self._unavailable_response()
+        
+        messages, strategy = self._prepare_messages(query, analysis, citations, retry_feedback)
+        
+        try:
+            answer = await self._ainvoke_llm(
+                messages=messages,
+                temperature=strategy["temperature"],
+                max_tokens=strategy["max_output_tokens"]
             )
+        except Exception as e:
+            return self._failed_response(e)
         
+        return self._finalize(answer, citations)
+    
+    @staticmethod
+    def _unavailable_response() -> LawyerResponse:
+        return LawyerResponse(
+            answer="抱歉，系統暫時無法生成答案（API未配置）",
+            confidence=0.0,
+            used_citations=[],
+            uncertainties=["系統配置問題"]
+        )
+    
+    @staticmethod
+    def _failed_response(e: Exception) -> LawyerResponse:
+        print(f"[Lawyer] LLM generation failed: {e}")
+        return LawyerResponse(
+            answer=f"抱歉，答案生成失敗：{str(e)}",
+            confidence=0.0,
+            used_citations=[],
+            uncertainties=["LLM 錯誤"]
+        )
+    
+    def _prepare_messages(
+        self,
+        query: str,
+        analysis: AnalysisResult,
+        citations: List[Dict],
+        retry_feedback: Optional[str]
+    ):
+        """組裝 LLM 訊息，回傳 (messages, strategy)"""
         # 1. 選擇 Prompt 策略
         strategy = self.prompt_strategies.get(
             analysis.query_type,
@@ -153,28 +214,14 @@ class LawyerAgent:
             topic_guidance=topic_guidance,
             retry_feedback=retry_feedback
         )
-        
-        # 4. 調用 LLM 生成答案
-        try:
-            answer = self._invoke_llm(
-                messages=[
-                    {"role": "system", "content": strategy["system_prompt"]},
-                    {"role": "user", "content": user_message}
-                ],
-                temperature=strategy["temperature"],
-                max_tokens=strategy["max_output_tokens"]
-            )
-        except Exception as e:
-            print(f"[Lawyer] LLM generation failed: {e}")
-            return LawyerResponse(
-                answer=f"抱歉，答案生成失敗：{str(e)}",
-                confidence=0.0,
-                used_citations=[],
-                uncertainties=["LLM 錯誤"]
-            )
-        
-        
-# 5. 提取使用的引用
+        messages = [
+            {"role": "system", "content": strategy["system_prompt"]},
+            {"role": "user", "content": user_message}
+        ]
+        return messages, strategy
+    
+    def _finalize(self, answer: str, citations: List[Dict]) -> LawyerResponse:
+        # 5. 提取使用的引用
         used_citations = self._extract_used_citations(answer, citations)
         
         # 6. 自我檢查
@@ -286,6 +333,28 @@ class LawyerAgent:
         )
         return (response.choices[0].message.content or '').strip()
 
+    async def _ainvoke_llm(self, messages, temperature: float, max_tokens: int) -> str:
+        """調用 LLM（非同步版本，與 _invoke_llm 相同的 API 選擇）"""
+        if not self.async_client:
+            return ""
+        
+        if self.model.startswith('gpt-5'):
+            response = await self.async_client.responses.create(
+                model=self.model,
+                input=messages,
+                temperature=temperature,
+                max_output_tokens=max_tokens
+            )
+            return self._extract_response_text(response)
+        
+        response = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_completion_tokens=max_tokens
+        )
+        return (response.choices[0].message.content or '').strip()
+
     def _extract_response_text(self, response) -> str:
         """�� Responses API ��X�峹��l�J��r��"""
         text = getattr(response, 'output_text', None)
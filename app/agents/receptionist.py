@@ -95,8 +95,8 @@ class ReceptionistAgent:
         
         # 方法1：使用 law_guides.yaml（更全面，30+主題）
         try:
-            from ..law_guides import LawGuideEngine
-            guide_engine = LawGuideEngine()
+            from ..law_guides import get_engine
+            guide_engine = get_engine()
             
             # 嘗試匹配所有可能的主題（可能有多個）
             query_lower = query.lower()
@@ -8,7 +8,7 @@ from pydantic import BaseModel
 from .receptionist import AnalysisResult
 from .lawyer import LawyerResponse
 from ..citation_validator import CitationValidator
-from ..law_guides import LawGuideEngine, TopicMatch
+from ..law_guides import TopicMatch, get_engine
 
 
 class ReviewResult(BaseModel):
@@ -36,7 +36,7 @@ class SupervisorAgent:
         # 整合 Phase 0 的引用驗證器
         self.citation_validator = CitationValidator()
         try:
-            self.law_guide_engine = LawGuideEngine()
+            self.law_guide_engine = get_engine()
         except Exception as exc:
             print(f"[Supervisor] Warning: failed to load law guides: {exc}")
             self.law_guide_engine = None
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import re
 import unicodedata
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, Tuple, Dict
 
@@ -124,7 +125,13 @@ def fuzzy_pick_file(query: str) -> Optional[Path]:
     return best[2] if best and best[0] > 0 else None
 
 
+@lru_cache(maxsize=4096)
 def find_article(law_query: str, article_no: str) -> Optional[dict]:
+    """Look up one article in data/laws; memoized since the corpus is fixed for the process.
+
+    The returned dict is shared between callers and must be treated as read-only
+    (call ``find_article.cache_clear()`` after replacing law files).
+    """
     target = fuzzy_pick_file(law_query)
     if not target:
         return None
@@ -3,7 +3,7 @@ from __future__ import annotations
 import json
 from functools import lru_cache
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List, Tuple
 
 ROOT = Path(__file__).resolve().parents[1]
 META_PATH = ROOT / "data" / "index" / "metadata.json"
@@ -27,15 +27,31 @@ def citation_from(title: str, heading: str) -> str:
     return title or heading or ""
 
 
-def decorate_citation(c: Dict) -> Dict:
+@lru_cache(maxsize=4096)
+def _citation_fields(source: str, heading: str) -> Tuple[str, str, str]:
+    """(title, citation, citation_md) for a source file / heading pair."""
     meta = load_metadata()
-    source = c.get("source_file", "")
-    heading = c.get("heading", "")
     title = meta.get(source, {}).get("title") or source.rsplit(".", 1)[0]
     cite = citation_from(title, heading)
+    return title, cite, f"- {cite}"
+
+
+def decorate_citation(c: Dict) -> Dict:
+    title, cite, cite_md = _citation_fields(c.get("source_file", ""), c.get("heading", ""))
     c2 = dict(c)
     c2["title"] = title
     c2["citation"] = cite
-    c2["citation_md"] = f"- {cite}"
+    c2["citation_md"] = cite_md
     return c2
 
+
+def decorate_citations(citations: List[Dict]) -> List[Dict]:
+    if not citations:
+        return []
+    fields = _citation_fields
+    out = []
+    append = out.append
+    for c in citations:
+        title, cite, cite_md = fields(c.get("source_file", ""), c.get("heading", ""))
+        append({**c, "title": title, "citation": cite, "citation_md": cite_md})
+    return out
@@ -12,7 +12,7 @@ Schema 設計原則：
 """
 import sqlite3
 from pathlib import Path
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple
 from datetime import datetime, timedelta
 import json
 from contextlib import contextmanager
@@ -139,6 +139,8 @@ class Database:
     def _init_db(self):
         """初始化資料庫（建立表與索引）"""
         with self.get_conn() as conn:
+            # WAL 為持久設定：讀寫互不阻塞，commit 不必每次整檔 fsync
+            conn.execute("PRAGMA journal_mode=WAL")
             conn.executescript(SCHEMA)
             conn.commit()
     
@@ -147,6 +149,7 @@ class Database:
         """Context manager 取得資料庫連線"""
         conn = sqlite3.connect(self.db_path, check_same_thread=False)
         conn.row_factory = sqlite3.Row  # 允許以字典形式訪問列
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL 下安全，減少 fsync
         try:
             yield conn
         finally:
@@ -207,6 +210,21 @@ class Database:
             conn.commit()
             return cursor.lastrowid
     
+    def add_messages_bulk(self, session_id: str, messages: List[Tuple[str, str]]) -> None:
+        """在單一交易中新增多則訊息 [(role, content), ...]（一次 commit）"""
+        if not messages:
+            return
+        with self.get_conn() as conn:
+            conn.executemany(
+                "INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)",
+                [(session_id, role, content) for role, content in messages]
+            )
+            conn.execute(
+                "UPDATE sessions SET updated_at = CURRENT_TIMESTAMP WHERE session_id = ?",
+                (session_id,)
+            )
+            conn.commit()
+    
     def get_session_messages(self, session_id: str) -> List[Dict]:
         """取得會話的所有訊息"""
         with self.get_conn() as conn:
@@ -22,7 +22,9 @@ if sys.platform == 'win32' and sys.stdout.encoding != 'utf-8':
 
 import json
 import time
-from typing import List, Dict, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
 import re
 from pydantic import BaseModel
 
@@ -33,6 +35,20 @@ except ImportError:
     OPENAI_AVAILABLE = False
     OpenAI = None
 
+try:
+    import httpx
+except ImportError:  # pragma: no cover - openai 已依賴 httpx
+    httpx = None
+
+try:
+    import h2  # noqa: F401  # httpx 的 HTTP/2 支援需要 h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# 串流檢查時於背景預先執行補檢索（所有 IntelligentRetriever 共用）
+_PREFETCH_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ir-prefetch")
+
 
 # ============================================================
 # Pydantic Models
@@ -68,6 +84,109 @@ class FinalValidationResult(BaseModel):
     missing_aspects: List[str]
 
 
+# ============================================================
+# Prompt builders
+# ============================================================
+
+@lru_cache(maxsize=8192)
+def _build_preanalyze_messages(query: str) -> Tuple[Dict[str, str], ...]:
+    """
+    建立前置分析的 messages（以查詢為鍵快取）
+    
+    回傳 tuple 以避免呼叫端修改快取內容；傳給 API 前請轉為 list。
+    """
+    # 🚀 優化：簡化 prompt 減少 token 數
+    prompt = f"""你是台灣勞動法律專家。分析問題涉及的法律面向。
+
+問題：{query}
+
+分析面向：程序、實體權利、行政義務、責任
+
+JSON 格式：
+{{
+    "aspects": [{{"type": "程序", "description": "簡述", "suggested_laws": ["法律名稱"]}}],
+    "suggested_laws": ["勞動基準法"],
+    "estimated_complexity": "medium",
+    "reasoning": "簡要說明"
+}}
+"""
+    return (
+        {"role": "system", "content": "你是台灣勞動法律專家，擅長分析法律問題的多維度。回答必須是有效的 JSON 格式。"},
+        {"role": "user", "content": prompt},
+    )
+
+
+# ============================================================
+# Streaming JSON helper
+# ============================================================
+
+class _MissingArticlesScanner:
+    """
+    增量掃描串流中的 JSON，每當 `missing_articles` 陣列中的一個物件結束，
+    就立即解析並回傳，讓補檢索可以在 LLM 尚未輸出完畢前就開始。
+    """
+    
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.in_array = False
+        self.done = False
+        self.depth = 0
+        self.obj_start = 0
+        self.in_string = False
+        self.escape = False
+    
+    def feed(self, text: str) -> List[Dict]:
+        """加入新片段，回傳本次新完成的 missing_articles 物件"""
+        self.buffer += text
+        completed: List[Dict] = []
+        if self.done:
+            return completed
+        
+        if not self.in_array:
+            key_pos = self.buffer.find('"missing_articles"')
+            if key_pos == -1:
+                return completed
+            bracket = self.buffer.find("[", key_pos)
+            if bracket == -1:
+                return completed
+            self.in_array = True
+            self.pos = bracket + 1
+        
+        buf = self.buffer
+        while self.pos < len(buf):
+            ch = buf[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                if self.depth == 0:
+                    self.obj_start = self.pos
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        item = json.loads(buf[self.obj_start:self.pos + 1])
+                        if isinstance(item, dict):
+                            completed.append(item)
+                    except json.JSONDecodeError:
+                        pass
+            elif ch == "]" and self.depth == 0:
+                self.done = True
+                self.pos += 1
+                break
+            self.pos += 1
+        
+        return completed
+
+
 # ============================================================
 # Main Intelligent Retriever Class
 # ============================================================
@@ -84,13 +203,14 @@ class IntelligentRetriever:
     3. 最終驗證：生成答案前的品質把關
     """
     
-    def __init__(self, api_key: str, model: str = "gpt-4o-mini"):
+    def __init__(self, api_key: str, model: str = "gpt-4o-mini", escalation_model: str = "gpt-4o"):
         """
         初始化智能檢索器
         
         Args:
             api_key: OpenAI API 金鑰
             model: LLM 模型名稱（默認 gpt-4o-mini）
+            escalation_model: 覆蓋率偏低時改用的較強模型（默認 gpt-4o）
         """
         if not OPENAI_AVAILABLE:
             raise RuntimeError("OpenAI package not installed")
@@ -98,10 +218,21 @@ class IntelligentRetriever:
         if not api_key:
             raise RuntimeError("OpenAI API key not provided")
         
-        self.client = OpenAI(api_key=api_key)
+        # 同一查詢會連續發出多次請求：共用連線池（可用時啟用 HTTP/2）以免重複 TLS 握手
+        self._http = None
+        if httpx is not None:
+            self._http = httpx.Client(
+                http2=HTTP2_AVAILABLE,
+                timeout=30.0,
+                limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+            )
+        self.client = OpenAI(api_key=api_key, http_client=self._http)
         self.model = model
+        self.escalation_model = escalation_model
         self.max_iterations = 2  # 最多迭代 2 輪（降低延遲）
         self.confidence_threshold = 0.8  # 高信心時提前退出
+        self.skip_check_coverage = 0.8  # 建議法律覆蓋率達此值時略過 LLM 檢查
+        self.escalate_coverage = 0.5  # 覆蓋率低於此值時改用 escalation_model
         self.last_iterations = 0
         self.last_forced_additions = 0
         
@@ -124,31 +255,12 @@ class IntelligentRetriever:
         """
         print(f"[Phase 2.5] 第一層：前置分析")
         
-        # 🚀 優化：簡化 prompt 減少 token 數
-        prompt = f"""你是台灣勞動法律專家。分析問題涉及的法律面向。
-
-問題：{query}
-
-分析面向：程序、實體權利、行政義務、責任
-
-JSON 格式：
-{{
-    "aspects": [{{"type": "程序", "description": "簡述", "suggested_laws": ["法律名稱"]}}],
-    "suggested_laws": ["勞動基準法"],
-    "estimated_complexity": "medium",
-    "reasoning": "簡要說明"
-}}
-"""
-        
         try:
             start_time = time.time()
             
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是台灣勞動法律專家，擅長分析法律問題的多維度。回答必須是有效的 JSON 格式。"},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=list(_build_preanalyze_messages(query)),
                 temperature=0.3,
                 response_format={"type": "json_object"}
             )
@@ -204,7 +316,13 @@ JSON 格式：
         """
         print(f"[Phase 2.5] 第二層：迭代式檢索")
         
-        results = initial_results.copy()
+        base_results = initial_results.copy()
+        # 補檢索結果依加入順序累積，需要時才反轉接到最前面
+        # （等同每次 insert(0)，但避免每次插入都搬移整個列表）
+        forced_results: List[Dict] = []
+        existing_keys = set()
+        for r in base_results:
+            self._add_existing_key(existing_keys, r)
         iteration = 0
         forced_total = 0
         self.last_iterations = 0
@@ -215,11 +333,14 @@ JSON 格式：
             self.last_iterations = iteration
             print(f"[Phase 2.5] 第 {iteration} 輪檢查...")
             
-            # 請 LLM 檢查當前檢索結果是否足夠
+            # 請 LLM 檢查當前檢索結果是否足夠（串流中即開始預先補檢索）
+            prefetched: Dict[Tuple[str, str], Future] = {}
             check_result = self._check_retrieval_completeness(
                 query, 
                 pre_analysis, 
-                results
+                forced_results[::-1] + base_results,
+                prefetched=prefetched,
+                existing_keys=existing_keys
             )
             
             # 如果 LLM 認為足夠，結束迭代
@@ -238,22 +359,19 @@ JSON 格式：
             for missing in check_result.missing_articles:
                 # 檢查是否已經存在（避免重複補充）
                 normalized_article = self._normalize_article_no(missing.get("article", ""))
-                already_exists = False
-                for r in results:
-                    existing_article = self._normalize_article_no(str(r.get("article_no", "")))
-                    if (r.get("law_name") == missing["law"] or r.get("law_id") == missing["law"]) and \
-                       existing_article == normalized_article:
-                        already_exists = True
-                        break
-                
-                if already_exists:
+                if (missing["law"], normalized_article) in existing_keys:
                     print(f"[Phase 2.5]   ➖ 已存在：{missing['law']} 第 {missing['article']} 條")
                     continue
                 
-                forced = self._force_retrieve(missing["law"], normalized_article)
+                future = prefetched.get((missing["law"], normalized_article))
+                if future is not None:
+                    forced = future.result()
+                else:
+                    forced = self._force_retrieve(missing["law"], normalized_article)
                 if forced:
-                    # 插入到結果最前面（高優先級）
-                    results.insert(0, forced)
+                    # 視為插入到結果最前面（高優先級）
+                    forced_results.append(forced)
+                    self._add_existing_key(existing_keys, forced)
                     print(f"[Phase 2.5]   ✓ 補檢索：{missing['law']} 第 {missing['article']} 條")
                     補充成功 += 1
                     forced_total += 1
@@ -268,6 +386,7 @@ JSON 格式：
         if iteration >= self.max_iterations:
             print(f"[Phase 2.5] ⚠️ 達到最大迭代次數 ({self.max_iterations})，可能仍有遺漏")
         
+        results = forced_results[::-1] + base_results
         self.last_forced_additions = forced_total
         print(f"[Phase 2.5] ✓ 迭代式檢索完成，最終結果: {len(results)} 條")
         return results
@@ -276,19 +395,41 @@ JSON 格式：
         self,
         query: str,
         pre_analysis: PreAnalysisResult,
-        results: List[Dict]
+        results: List[Dict],
+        prefetched: Optional[Dict[Tuple[str, str], Future]] = None,
+        existing_keys: Optional[set] = None
     ) -> RetrievalCheckResult:
         """
         讓 LLM 檢查檢索結果是否完整
         
+        以串流方式接收回應；每當 `missing_articles` 中的一筆完成，就立即
+        在背景提交 `_force_retrieve`，與 LLM 產生剩餘內容的時間重疊。
+        
         Args:
             query: 用戶查詢
             pre_analysis: 前置分析結果
             results: 當前檢索結果
+            prefetched: 預先補檢索的 Future，鍵為 (法律名稱, 正規化條號)
+            existing_keys: 已存在結果的 (法律名稱, 正規化條號) 集合，用於略過預取
             
         Returns:
             RetrievalCheckResult: 檢查結果
         """
+        # 🚀 分級：先以建議法律覆蓋率判斷是否需要呼叫 LLM、以及使用哪個模型
+        coverage = self._coverage_score(pre_analysis, results)
+        model = self.model
+        if coverage is not None:
+            if coverage >= self.skip_check_coverage:
+                print(f"[Phase 2.5] ⚡ 建議法律覆蓋率 {coverage:.2f}，略過 LLM 檢查")
+                return RetrievalCheckResult(
+                    is_sufficient=True,
+                    reason=f"建議法律覆蓋率 {coverage:.2f}，視為完整",
+                    missing_articles=[],
+                    confidence=0.95
+                )
+            if coverage < self.escalate_coverage:
+                model = self.escalation_model
+        
         # 格式化當前檢索結果
         citations_summary = self._format_citations_for_check(results)
         aspects_summary = "\n".join([
@@ -317,17 +458,29 @@ JSON：
 """
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
+            stream = self.client.chat.completions.create(
+                model=model,
                 messages=[
                     {"role": "system", "content": "你是檢索品質檢查專家，專門判斷法條檢索是否完整。回答必須是有效的 JSON 格式。"},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.2,
-                response_format={"type": "json_object"}
+                response_format={"type": "json_object"},
+                stream=True
             )
             
-            result_json = json.loads(response.choices[0].message.content)
+            scanner = _MissingArticlesScanner()
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                for missing in scanner.feed(delta):
+                    if prefetched is not None:
+                        self._prefetch_missing(missing, existing_keys or set(), prefetched)
+            
+            result_json = json.loads(scanner.buffer)
             result = RetrievalCheckResult(**result_json)
             
             return result
@@ -342,6 +495,46 @@ JSON：
                 confidence=0.5
             )
     
+    @staticmethod
+    def _coverage_score(pre_analysis: PreAnalysisResult, results: List[Dict]) -> Optional[float]:
+        """
+        計算前置分析建議的法律中，已出現在檢索結果的比例
+        
+        Returns:
+            0-1 的覆蓋率；若無建議法律則回傳 None（無法判斷）
+        """
+        suggested = {law for law in pre_analysis.suggested_laws if law}
+        if not suggested:
+            return None
+        retrieved = set()
+        for r in results:
+            retrieved.add(r.get("law_name"))
+            retrieved.add(r.get("law_id"))
+        return len(suggested & retrieved) / len(suggested)
+    
+    def _add_existing_key(self, existing_keys: set, result: Dict) -> None:
+        """記錄結果的 (法律名稱, 正規化條號)，law_name 與 law_id 皆可比對"""
+        article = self._normalize_article_no(str(result.get("article_no", "")))
+        for law in (result.get("law_name"), result.get("law_id")):
+            if law:
+                existing_keys.add((law, article))
+    
+    def _prefetch_missing(
+        self,
+        missing: Dict,
+        existing_keys: set,
+        prefetched: Dict[Tuple[str, str], Future]
+    ) -> None:
+        """對串流中剛完成的缺漏法條提交背景補檢索（已存在者略過）"""
+        law = missing.get("law")
+        if not law:
+            return
+        normalized_article = self._normalize_article_no(str(missing.get("article", "")))
+        key = (law, normalized_article)
+        if key in prefetched or key in existing_keys:
+            return
+        prefetched[key] = _PREFETCH_POOL.submit(self._force_retrieve, law, normalized_article)
+    
     def _format_citations_for_check(self, results: List[Dict]) -> str:
         """格式化檢索結果供 LLM 檢查"""
         lines = []
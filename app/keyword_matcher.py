@@ -0,0 +1,64 @@
+"""多組關鍵詞的一次性比對：以 Aho–Corasick 自動機單趟掃描查詢字串，找出各分類命中的關鍵詞。
+
+未安裝 pyahocorasick 時退回每個分類一個前瞻正規式（同樣能找出重疊的關鍵詞）。
+"""
+from __future__ import annotations
+
+import re
+from typing import Dict, FrozenSet, Iterable, Set
+
+try:
+    import ahocorasick  # type: ignore
+except ImportError:  # pragma: no cover - optional speedup
+    ahocorasick = None
+
+
+class KeywordMatcher:
+    """Find which keywords of each category occur in a text, in one pass."""
+
+    def __init__(self, categories: Dict[str, Iterable[str]]) -> None:
+        self.categories: Dict[str, FrozenSet[str]] = {
+            name: frozenset(k for k in keywords if k) for name, keywords in categories.items()
+        }
+        self._automaton = None
+        self._patterns: Dict[str, "re.Pattern[str]"] = {}
+        self._prefixes: Dict[str, Dict[str, FrozenSet[str]]] = {}
+        if ahocorasick is not None:
+            tagged: Dict[str, Set[str]] = {}
+            for name, keywords in self.categories.items():
+                for kw in keywords:
+                    tagged.setdefault(kw, set()).add(name)
+            if tagged:
+                self._automaton = ahocorasick.Automaton()
+                for kw, names in tagged.items():
+                    self._automaton.add_word(kw, (kw, tuple(names)))
+                self._automaton.make_automaton()
+        else:
+            for name, keywords in self.categories.items():
+                if not keywords:
+                    continue
+                # 前瞻斷言讓每個位置都嘗試比對（長者優先），同位置較短的關鍵詞由前綴表補回
+                alternation = "|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+                self._patterns[name] = re.compile(f"(?=({alternation}))")
+                self._prefixes[name] = {
+                    kw: frozenset(o for o in keywords if o != kw and kw.startswith(o)) for kw in keywords
+                }
+
+    def scan(self, text: str) -> Dict[str, Set[str]]:
+        """Map each category with at least one hit to the distinct keywords found."""
+        hits: Dict[str, Set[str]] = {}
+        if self._automaton is not None:
+            for _, (kw, names) in self._automaton.iter(text):
+                for name in names:
+                    hits.setdefault(name, set()).add(kw)
+            return hits
+        for name, pattern in self._patterns.items():
+            prefixes = self._prefixes[name]
+            found: Set[str] = set()
+            for kw in pattern.findall(text):
+                if kw not in found:
+                    found.add(kw)
+                    found.update(prefixes[kw])
+            if found:
+                hits[name] = found
+        return hits
@@ -7,15 +7,21 @@ Knowledge Graph Module - 知識圖譜模組
 - 匹配預定義情境
 - 強化檢索結果
 
-基於 NetworkX 實現圖遍歷和查詢
+以 CSR（壓縮稀疏列）整數鄰接表實現圖遍歷和查詢
 """
 
 from __future__ import annotations
 
 import json
+from collections import deque
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Set
-import networkx as nx
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
 
 ROOT = Path(__file__).resolve().parents[1]
 KG_PATH = ROOT / "data" / "knowledge_graph.json"
@@ -36,10 +42,18 @@ class KnowledgeGraph:
         """初始化知識圖譜"""
         self.kg_path = kg_path
         self.data: Dict = {}
-        self.graph: nx.DiGraph = nx.DiGraph()
         self.entities: Dict = {}
         self.scenarios: Dict = {}
         
+        # CSR 鄰接表：節點 u 的鄰居為 neighbors[indptr[u]:indptr[u + 1]]
+        self.id2idx: Dict[str, int] = {}
+        self.idx2id: List[str] = []
+        self.idx2data: List[Dict] = []
+        self.indptr: np.ndarray = np.zeros(1, dtype=np.int32)
+        self.neighbors: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.edge_types: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.relation_type_names: List[str] = []
+        
         if self.kg_path.exists():
             self._load()
         else:
@@ -47,13 +61,17 @@ class KnowledgeGraph:
     
     def _load(self) -> None:
         """載入知識圖譜數據"""
-        with open(self.kg_path, 'r', encoding='utf-8') as f:
-            self.data = json.load(f)
+        # orjson 解析速度約為標準庫的數倍（可選依賴）
+        if orjson is not None:
+            self.data = orjson.loads(self.kg_path.read_bytes())
+        else:
+            with open(self.kg_path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
         
         self.entities = self.data.get("entities", {})
         self.scenarios = self.data.get("scenarios", {})
         
-        # 建立 NetworkX 圖
+        # 建立 CSR 鄰接表
         self._build_graph()
         
         metadata = self.data.get("metadata", {})
@@ -62,20 +80,54 @@ class KnowledgeGraph:
               f"{metadata.get('scenario_count', 0)} scenarios")
     
     def _build_graph(self) -> None:
-        """建立 NetworkX 有向圖"""
+        """建立 CSR 整數鄰接表（每個節點一段連續的鄰居陣列）"""
+        id2idx = self.id2idx
+        idx2id = self.idx2id
+        idx2data = self.idx2data
+        
+        def _index_of(entity_id: str) -> int:
+            idx = id2idx.get(entity_id)
+            if idx is None:
+                idx = len(idx2id)
+                id2idx[entity_id] = idx
+                idx2id.append(entity_id)
+                idx2data.append({})
+            return idx
+        
         # 添加節點
         for entity_id, entity_data in self.entities.items():
-            self.graph.add_node(entity_id, **entity_data)
-        
-        # 添加邊
-        relations = self.data.get("relations", [])
-        for rel in relations:
-            self.graph.add_edge(
-                rel["from"],
-                rel["to"],
-                type=rel["type"],
-                description=rel.get("description", "")
-            )
+            idx = _index_of(entity_id)
+            idx2data[idx] = entity_data
+        
+        # 添加邊（同一對節點重複出現時保留最後的關係類型）
+        type_codes: Dict[str, int] = {}
+        adjacency: List[Dict[int, int]] = []
+        for rel in self.data.get("relations", []):
+            u = _index_of(rel["from"])
+            v = _index_of(rel["to"])
+            rel_type = rel["type"]
+            code = type_codes.setdefault(rel_type, len(type_codes))
+            while len(adjacency) < len(idx2id):
+                adjacency.append({})
+            adjacency[u][v] = code
+        while len(adjacency) < len(idx2id):
+            adjacency.append({})
+        
+        counts = np.fromiter((len(a) for a in adjacency), dtype=np.int32, count=len(adjacency))
+        self.indptr = np.zeros(len(adjacency) + 1, dtype=np.int32)
+        np.cumsum(counts, out=self.indptr[1:])
+        self.neighbors = np.fromiter(
+            (v for a in adjacency for v in a), dtype=np.int32, count=int(self.indptr[-1])
+        )
+        self.edge_types = np.fromiter(
+            (c for a in adjacency for c in a.values()), dtype=np.int32, count=int(self.indptr[-1])
+        )
+        self.relation_type_names = list(type_codes)
+    
+    @property
+    def num_edges(self) -> int:
+        """圖中（去重後）的邊數"""
+        return int(self.neighbors.shape[0])
     
     def find_related_articles(
         self,
@@ -94,36 +146,46 @@ class KnowledgeGraph:
         Returns:
             List of (article_id, depth, article_data)
         """
-        if article_id not in self.graph:
+        start = self.id2idx.get(article_id)
+        if start is None:
             return []
         
+        allowed_codes = None
+        if relation_types is not None:
+            allowed_codes = {
+                code for code, name in enumerate(self.relation_type_names)
+                if name in relation_types
+            }
+        
+        indptr = self.indptr
+        neighbors = self.neighbors
+        edge_types = self.edge_types
+        
         related = []
-        visited: Set[str] = set()
-        queue: List[Tuple[str, int]] = [(article_id, 0)]
+        visited = np.zeros(len(self.idx2id), dtype=bool)
+        queue = deque([(start, 0)])
         
         while queue:
-            node, depth = queue.pop(0)
+            node, depth = queue.popleft()
             
-            if node in visited or depth > max_depth:
+            if visited[node] or depth > max_depth:
                 continue
             
-            visited.add(node)
+            visited[node] = True
             
             # 添加到結果（排除起始節點）
-            if node != article_id:
-                node_data = self.graph.nodes.get(node, {})
-                related.append((node, depth, node_data))
+            if node != start:
+                related.append((self.idx2id[node], depth, self.idx2data[node]))
             
             # 遍歷鄰居
             if depth < max_depth:
-                for neighbor in self.graph.neighbors(node):
-                    if neighbor not in visited:
-                        # 檢查關係類型
-                        edge_data = self.graph.get_edge_data(node, neighbor, {})
-                        rel_type = edge_data.get("type", "")
-                        
-                        if relation_types is None or rel_type in relation_types:
-                            queue.append((neighbor, depth + 1))
+                lo, hi = indptr[node], indptr[node + 1]
+                for neighbor, code in zip(neighbors[lo:hi].tolist(), edge_types[lo:hi].tolist()):
+                    if visited[neighbor]:
+                        continue
+                    # 檢查關係類型
+                    if allowed_codes is None or code in allowed_codes:
+                        queue.append((neighbor, depth + 1))
         
         return related
     
@@ -257,29 +319,31 @@ class KnowledgeGraph:
             return citations
         
         # 檢查必需條文是否已在引用中
-        cited_ids = set()
-        for cite in citations:
-            law_name = cite.get("law_name", "")
-            article_no = cite.get("article_no", "")
-            if law_name and article_no:
-                article_id = f"{law_name}第{article_no}條"
-                cited_ids.add(article_id)
+        cited_ids = {
+            f"{c['law_name']}第{c['article_no']}條"
+            for c in citations
+            if c.get("law_name") and c.get("article_no")
+        }
+        missing = [a for a in required_articles if a not in cited_ids]
+        if not missing:
+            # 與補入條文時一致，回傳新串列（呼叫端可能會修改結果）
+            return list(citations)
         
         # 添加缺失的必需條文
         enhanced = list(citations)
-        for req_art in required_articles:
-            if req_art not in cited_ids:
-                article_info = self.get_article_info(req_art)
-                if article_info:
-                    # 構建引用格式
-                    enhanced.append({
-                        "law_name": article_info.get("law", ""),
-                        "article_no": article_info.get("article", ""),
-                        "heading": article_info.get("title", ""),
-                        "text": "",  # 需要從其他地方獲取完整文本
-                        "source": "knowledge_graph",
-                        "kg_enforced": True
-                    })
+        entities = self.entities
+        for req_art in missing:
+            article_info = entities.get(req_art)
+            if article_info:
+                # 構建引用格式
+                enhanced.append({
+                    "law_name": article_info.get("law", ""),
+                    "article_no": article_info.get("article", ""),
+                    "heading": article_info.get("title", ""),
+                    "text": "",  # 需要從其他地方獲取完整文本
+                    "source": "knowledge_graph",
+                    "kg_enforced": True
+                })
         
         return enhanced
 
@@ -1,14 +1,61 @@
 from __future__ import annotations
 
+import heapq
+import os
+import pickle
+from array import array
+import re
+import sys
+import threading
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, NamedTuple
 
 import yaml
 
+try:
+    import ahocorasick  # type: ignore
+except ImportError:  # pragma: no cover - optional speedup
+    ahocorasick = None
+
 ROOT = Path(__file__).resolve().parents[1]
 GUIDE_PATH = ROOT / "data" / "law_guides.yaml"
 
 
+def _load_guides(guide_path: Path) -> Dict[str, Dict]:
+    """
+    Load topics from law_guides.yaml, reusing a pickled sidecar when fresh.
+
+    The sidecar (``law_guides.yaml.pkl``) records the YAML's mtime and size and
+    is only used when both still match, so a restored older YAML (``cp -p``,
+    backups) is never shadowed by a newer cache. A missing, stale or corrupt
+    sidecar falls back to parsing the YAML.
+    """
+    cache_path = guide_path.with_suffix(".yaml.pkl")
+    st = guide_path.stat()
+    stamp = (st.st_mtime_ns, st.st_size)
+    try:
+        cached = pickle.loads(cache_path.read_bytes())
+        if isinstance(cached, dict) and cached.get("stamp") == stamp:
+            return cached["topics"]
+    except Exception:
+        pass
+
+    raw = yaml.safe_load(guide_path.read_text(encoding="utf-8")) or {}
+    guides = raw.get("topics", {})
+
+    # Atomic write: readers never observe a half-written sidecar
+    try:
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        payload = {"stamp": stamp, "topics": guides}
+        tmp_path.write_bytes(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+        os.replace(tmp_path, cache_path)
+    except Exception as exc:
+        print(f"[LawGuides] Failed to write guide cache: {exc}")
+    return guides
+
+
 class TopicMatch(NamedTuple):
     """Represents a matched topic with scoring details."""
     topic_id: str
@@ -35,8 +82,116 @@ class LawGuideEngine:
     def __init__(self, guide_path: Path = GUIDE_PATH):
         if not guide_path.exists():
             raise RuntimeError(f"law guide not found: {guide_path}")
-        raw = yaml.safe_load(guide_path.read_text(encoding="utf-8"))
-        self.guides: Dict[str, Dict] = raw.get("topics", {})
+        self.guides: Dict[str, Dict] = _load_guides(guide_path)
+
+        # Precompiled boost entries per topic: (core_law, article set or None, priority).
+        # An article set of None means "any article of this law". Law, article and
+        # (below) keyword strings are interned: they repeat across topics, so dedup
+        # and lookups mostly compare by identity before hashing content.
+        self._boost: Dict[str, Tuple[Tuple[str, Optional[frozenset], float], ...]] = {}
+        for topic_id, guide in self.guides.items():
+            entries = []
+            for entry in guide.get("core_articles", []) or []:
+                core_law = entry.get("law") or ""
+                if not core_law:
+                    continue
+                core_law = sys.intern(core_law)
+                articles = frozenset(sys.intern(str(a)) for a in entry.get("articles", []) or [])
+                entries.append((core_law, articles or None, float(entry.get("priority") or 1.0)))
+            self._boost[topic_id] = tuple(entries)
+        # (topic_id, doc law) -> matching (article set, priority) entries.
+        # Matching stays substring-based (`core_law in law`): docs without a law_id
+        # fall back to their title, which carries more than the bare law name.
+        # Canonical law ids (every core law named in the guide) are resolved here
+        # up front; boost_results matches any other doc law (e.g. a title) inline
+        # without writing back, so the shared engine stays read-only.
+        self._boost_by_law: Dict[Tuple[str, str], Tuple[Tuple[Optional[frozenset], float], ...]] = {}
+        all_core_laws = {core_law for entries in self._boost.values() for core_law, _, _ in entries}
+        for topic_id, entries in self._boost.items():
+            for law in all_core_laws:
+                self._boost_by_law[(topic_id, law)] = tuple(
+                    (arts, prio) for core_law, arts, prio in entries if core_law in law
+                )
+
+        # Precompiled keyword tables for match_topics, as parallel per-topic arrays.
+        # Guide dicts are not carried through scoring; the top-K look theirs up by id.
+        self._topic_ids: List[str] = []
+        self._keywords: List[Tuple[str, ...]] = []
+        self._max_priority = array("d")
+        self._category_weight = array("d")
+        self._category: List[str] = []
+        for topic_id, guide in self.guides.items():
+            max_priority = 1.0
+            for entry in guide.get("core_articles", []) or []:
+                p = float(entry.get("priority") or 1.0)
+                if p > max_priority:
+                    max_priority = p
+            category = guide.get("category", "general")
+            self._topic_ids.append(topic_id)
+            self._keywords.append(tuple(sys.intern(kw.lower()) for kw in (guide.get("keywords") or []) if kw))
+            self._max_priority.append(max_priority)
+            self._category_weight.append(CATEGORY_WEIGHT.get(category, 1.0))
+            self._category.append(category)
+
+        # Per-topic deduped merge inputs (guides are immutable after load)
+        self._topic_prior_articles: Dict[str, Tuple[str, ...]] = {}
+        self._topic_preferred_laws: Dict[str, Tuple[str, ...]] = {}
+        self._topic_blocked_laws: Dict[str, Tuple[str, ...]] = {}
+        for topic_id, guide in self.guides.items():
+            priors: Dict[str, None] = {}
+            laws: Dict[str, None] = {}
+            for entry in guide.get("core_articles", []) or []:
+                law = entry.get("law")
+                if law:
+                    laws[sys.intern(law)] = None
+                for art in entry.get("articles", []) or []:
+                    priors[sys.intern(str(art))] = None
+            self._topic_prior_articles[topic_id] = tuple(priors)
+            self._topic_preferred_laws[topic_id] = tuple(laws)
+            self._topic_blocked_laws[topic_id] = tuple(
+                dict.fromkeys(sys.intern(b) for b in guide.get("blocked_laws", []) or [] if b)
+            )
+
+        # Inverted index keyword -> topic indices, one entry per occurrence so a
+        # keyword listed twice in a topic keeps counting twice. Shared keywords
+        # are then tested against the query once instead of once per topic.
+        owners: Dict[str, List[int]] = {}
+        for ti, kws in enumerate(self._keywords):
+            for kw in kws:
+                owners.setdefault(kw, []).append(ti)
+        self._kw_to_topics: Dict[str, Tuple[int, ...]] = {
+            kw: tuple(topic_idx) for kw, topic_idx in owners.items()
+        }
+
+        # Fallback postings: (first char, UTF-8 keyword, topic indices). UTF-8 is
+        # self-synchronizing, so a byte-level substring hit is exactly a
+        # character-level one; the first char rejects most keywords cheaply.
+        self._kw_postings: List[Tuple[str, bytes, Tuple[int, ...]]] = [
+            (kw[0], kw.encode("utf-8"), topic_idx) for kw, topic_idx in self._kw_to_topics.items()
+        ]
+
+        # Queries shorter than the shortest keyword cannot match anything
+        self._min_keyword_len = min((len(kw) for kw in self._kw_to_topics), default=1)
+
+        # Keyword alternation: one C-level pass rejects queries that hit no topic at all
+        self._any_keyword: Optional[re.Pattern] = (
+            re.compile("|".join(re.escape(kw) for kw in self._kw_to_topics)) if self._kw_to_topics else None
+        )
+
+        # One Aho–Corasick automaton over all keywords
+        self._ac = None
+        if ahocorasick is not None and self._kw_to_topics:
+            self._ac = ahocorasick.Automaton()
+            for kw, topic_idx in self._kw_to_topics.items():
+                self._ac.add_word(kw, (kw, topic_idx))
+            self._ac.make_automaton()
+
+        # Per-thread scratch buffers reused by every match_topics call on that thread
+        # (requests are served from a thread pool, so a shared buffer would race)
+        self._scratch = threading.local()
+
+        # Per-instance memo of match results keyed by lowered query
+        self._match_topics_cached = lru_cache(maxsize=1024)(self._match_topics_impl)
 
     # ==================== 🆕 Phase 2.7: Multi-topic Matching ====================
     
@@ -52,45 +207,79 @@ class LawGuideEngine:
         3. Weighting by category (definition > procedure > penalty)
         4. Returning ALL matches sorted by score
         """
-        query = (query or "").lower()
-        matches: List[TopicMatch] = []
+        q = (query or "").strip().lower()
+        if len(q) < self._min_keyword_len:
+            return []
+        return list(self._match_topics_cached(q, max_topics))
+    
+    def _match_topics_impl(self, query: str, max_topics: int) -> Tuple[TopicMatch, ...]:
+        """Uncached body of match_topics; ``query`` is already lowered."""
+        # Plain (score, topic index, hit_count) tuples; TopicMatch is built for the top-K only
+        scored: List[Tuple[float, int, int]] = self._scratch_buf("scored", list)
         
-        for topic_id, guide in self.guides.items():
-            keywords = guide.get("keywords") or []
-            
-            # Count keyword hits (case-insensitive)
-            hit_count = sum(1 for kw in keywords if kw and kw.lower() in query)
-            
-            if hit_count == 0:
-                continue
-            
-            # Get max priority from core_articles
-            max_priority = 1.0
-            for entry in guide.get("core_articles", []):
-                p = float(entry.get("priority") or 1.0)
-                if p > max_priority:
-                    max_priority = p
-            
-            # Get category (default to "general")
-            category = guide.get("category", "general")
-            category_weight = CATEGORY_WEIGHT.get(category, 1.0)
+        hit_counts = self._count_hits(query)
+        
+        # Only topics with hits are scored; index order keeps ties in guide order
+        for ti in sorted(hit_counts):
+            hit_count = hit_counts[ti]
             
             # Calculate final score
-            score = hit_count * max_priority * category_weight
-            
-            matches.append(TopicMatch(
-                topic_id=topic_id,
-                guide=guide,
+            score = hit_count * self._max_priority[ti] * self._category_weight[ti]
+            scored.append((score, ti, hit_count))
+        
+        # Top-K by score descending (ties keep guide order, same as a stable sort)
+        top = heapq.nlargest(max_topics, scored, key=itemgetter(0))
+        
+        return tuple(
+            TopicMatch(
+                topic_id=self._topic_ids[ti],
+                guide=self.guides[self._topic_ids[ti]],
                 hit_count=hit_count,
-                priority=max_priority,
-                category=category,
+                priority=self._max_priority[ti],
+                category=self._category[ti],
                 score=score
-            ))
-        
-        # Sort by score descending
-        matches.sort(key=lambda m: m.score, reverse=True)
+            )
+            for score, ti, hit_count in top
+        )
+    
+    def _scratch_buf(self, name: str, factory):
+        """Return this thread's cleared scratch container ``name``."""
+        buf = getattr(self._scratch, name, None)
+        if buf is None:
+            buf = factory()
+            setattr(self._scratch, name, buf)
+        else:
+            buf.clear()
+        return buf
+    
+    def _count_hits(self, query: str) -> Dict[int, int]:
+        """
+        Distinct keywords found in the (lowered) query, per topic index.
+
+        Sparse: topics without hits are absent, so scoring never walks them.
+        """
+        if self._ac is None:
+            hit_counts: Dict[int, int] = self._scratch_buf("hits", dict)
+            if self._any_keyword is None or not self._any_keyword.search(query):
+                return hit_counts
+            query_chars = set(query)
+            query_bytes = query.encode("utf-8")
+            for first, kw, topic_idx in self._kw_postings:
+                if first in query_chars and kw in query_bytes:
+                    for ti in topic_idx:
+                        hit_counts[ti] = hit_counts.get(ti, 0) + 1
+            return hit_counts
         
-        return matches[:max_topics]
+        hit_counts = self._scratch_buf("hits", dict)
+        seen = self._scratch_buf("seen", set)
+        for _, (kw, topic_idx) in self._ac.iter(query):
+            # A keyword counts once no matter how often it occurs (same as `kw in query`)
+            if kw in seen:
+                continue
+            seen.add(kw)
+            for ti in topic_idx:
+                hit_counts[ti] = hit_counts.get(ti, 0) + 1
+        return hit_counts
     
     def match_topic(self, query: str) -> Tuple[Optional[str], Optional[Dict]]:
         """
@@ -107,50 +296,26 @@ class LawGuideEngine:
         Merge prior_articles from ALL matched topics.
         De-duplicate and preserve priority order.
         """
-        seen = set()
-        result: List[str] = []
-        
-        for match in matches:
-            for entry in match.guide.get("core_articles", []):
-                for art in entry.get("articles", []):
-                    art_str = str(art)
-                    if art_str not in seen:
-                        seen.add(art_str)
-                        result.append(art_str)
-        
-        return result
+        return list(dict.fromkeys(
+            art for match in matches for art in self._topic_prior_articles[match.topic_id]
+        ))
     
     def get_merged_preferred_laws(self, matches: List[TopicMatch]) -> List[str]:
         """
         Merge preferred_laws from ALL matched topics.
         De-duplicate and preserve priority order.
         """
-        seen = set()
-        result: List[str] = []
-        
-        for match in matches:
-            for entry in match.guide.get("core_articles", []):
-                law = entry.get("law")
-                if law and law not in seen:
-                    seen.add(law)
-                    result.append(law)
-        
-        return result
+        return list(dict.fromkeys(
+            law for match in matches for law in self._topic_preferred_laws[match.topic_id]
+        ))
     
     def get_merged_blocked_laws(self, matches: List[TopicMatch]) -> List[str]:
         """
         Merge blocked_laws from ALL matched topics.
         """
-        seen = set()
-        result: List[str] = []
-        
-        for match in matches:
-            for b in match.guide.get("blocked_laws", []) or []:
-                if b and b not in seen:
-                    seen.add(b)
-                    result.append(b)
-        
-        return result
+        return list(dict.fromkeys(
+            b for match in matches for b in self._topic_blocked_laws[match.topic_id]
+        ))
 
     def get_preferred_laws(self, topic_id: Optional[str]) -> List[str]:
         if not topic_id or topic_id not in self.guides:
@@ -183,21 +348,34 @@ class LawGuideEngine:
     ) -> List[Tuple[float, Dict]]:
         if not topic_id or topic_id not in self.guides:
             return items
-        core = self.guides[topic_id].get("core_articles", [])
-        if not core:
+        if not self.guides[topic_id].get("core_articles", []):
             return items
+        entries = self._boost[topic_id]
+        # Docs share a handful of law ids, whose substring matches were resolved in __init__
+        entries_by_law = self._boost_by_law
         boosted: List[Tuple[float, Dict]] = []
         for score, doc in items:
-            new_score = score
             law = doc.get("law_id") or doc.get("title") or ""
-            art = str(doc.get("article_no") or "").strip()
-            for entry in core:
-                core_law = entry.get("law") or ""
-                articles = [str(a) for a in entry.get("articles", [])]
-                priority = float(entry.get("priority") or 1.0)
-                if core_law and core_law in law and (not articles or art in articles):
-                    new_score *= priority
-                    break
-            boosted.append((new_score, doc))
-        boosted.sort(key=lambda x: x[0], reverse=True)
+            candidates = entries_by_law.get((topic_id, law))
+            if candidates is None:
+                candidates = tuple((arts, prio) for core_law, arts, prio in entries if core_law in law)
+            if candidates:
+                art = str(doc.get("article_no") or "").strip()
+                for arts, prio in candidates:
+                    if arts is None or art in arts:
+                        score *= prio
+                        break
+            boosted.append((score, doc))
+        boosted.sort(key=itemgetter(0), reverse=True)
         return boosted
+
+
+@lru_cache(maxsize=8)
+def get_engine(guide_path: Path = GUIDE_PATH) -> LawGuideEngine:
+    """
+    Shared LawGuideEngine per guide file.
+
+    Engines are read-only after construction, so one instance can serve every
+    caller. Call ``get_engine.cache_clear()`` after editing the YAML to reload.
+    """
+    return LawGuideEngine(guide_path)
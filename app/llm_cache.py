@@ -0,0 +1,154 @@
+"""LLM 輸出快取：以 (model, 訊息內容, 參數) 雜湊為鍵的 LRU，並寫入 logs/llm_cache.jsonl 以便重啟後沿用。
+
+只快取 LLM 回傳的原始字串；解析與 Pydantic 模型建立留給呼叫端。
+寫檔由背景執行緒進行，請求端只需入列；條目超過 CACHE_TTL 即視為失效。
+"""
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_PATH = ROOT / "logs" / "llm_cache.jsonl"
+CACHE_SIZE = 1024
+CACHE_TTL = 24 * 3600.0  # 秒；跨重啟沿用，以牆鐘時間計算
+
+
+def cache_key(model: str, messages: Any, **params: Any) -> str:
+    """Content-addressed key for one LLM call."""
+    payload = json.dumps([model, messages, params], ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class _CacheWriter:
+    """Background appender: callers only enqueue, the file is opened once and flushed when the queue drains."""
+
+    _STOP = object()
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._drain, name="llm-cache-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, line: str) -> None:
+        self._queue.put(line)
+
+    def close(self, timeout: float = 2.0) -> None:
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+
+    def _drain(self) -> None:
+        fp = None
+        while True:
+            line = self._queue.get()
+            if line is self._STOP:
+                break
+            try:
+                if fp is None:
+                    self.path.parent.mkdir(exist_ok=True)
+                    fp = self.path.open("a", encoding="utf-8")
+                fp.write(line)
+                if self._queue.empty():
+                    fp.flush()
+            except OSError as exc:
+                print(f"[LLMCache] Failed to persist entry: {exc}")
+        if fp is not None:
+            fp.close()
+
+
+class LLMCache:
+    """Thread-safe LRU of raw LLM text with a TTL, persisted append-only and loaded lazily."""
+
+    def __init__(self, path: Path = CACHE_PATH, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL) -> None:
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (寫入時間, 內容)
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._writer: Optional[_CacheWriter] = None
+
+    def _load(self) -> None:
+        """Read the persisted log once, skipping expired entries; compact it when it carries many stale lines."""
+        self._loaded = True
+        if not self.path.exists():
+            return
+        lines = 0
+        cutoff = time.time() - self.ttl
+        try:
+            with self.path.open("r", encoding="utf-8") as fp:
+                for line in fp:
+                    lines += 1
+                    try:
+                        item = json.loads(line)
+                        stamp = float(item.get("t", 0.0))
+                        if stamp < cutoff:
+                            continue
+                        self._entries[item["k"]] = (stamp, item["v"])
+                        self._entries.move_to_end(item["k"])
+                    except (ValueError, KeyError, TypeError, AttributeError):
+                        continue
+        except OSError as exc:
+            print(f"[LLMCache] Failed to load cache: {exc}")
+            return
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        if lines > 2 * max(len(self._entries), self.maxsize // 2):
+            self._rewrite()
+
+    def _rewrite(self) -> None:
+        try:
+            with self.path.open("w", encoding="utf-8") as fp:
+                for k, (t, v) in self._entries.items():
+                    fp.write(self._encode(k, t, v))
+        except OSError as exc:
+            print(f"[LLMCache] Failed to compact cache: {exc}")
+
+    @staticmethod
+    def _encode(key: str, stamp: float, value: str) -> str:
+        return json.dumps({"k": key, "t": stamp, "v": value}, ensure_ascii=False) + "\n"
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, value: str) -> None:
+        if not value:
+            return
+        stamp = time.time()
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._entries[key] = (stamp, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            if self._writer is None:
+                self._writer = _CacheWriter(self.path)
+        self._writer.put(self._encode(key, stamp, value))
+
+
+@lru_cache(maxsize=1)
+def get_llm_cache() -> LLMCache:
+    """Process-wide LLM output cache."""
+    return LLMCache()
@@ -8,22 +8,41 @@ if sys.platform == 'win32' and sys.stdout.encoding != 'utf-8':
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
 import os
+import re
+import json
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Optional
-from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from starlette.staticfiles import StaticFiles
 from pydantic import BaseModel
+from openai import OpenAI, AsyncOpenAI
+import httpx
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
 
 from .rag_utils import load_index, search as tfidf_search
-from .vector_store import is_available as vector_available, search as vector_search, warmup as vector_warmup
-from .retrieval import hybrid_search
+from .vector_store import is_available as vector_available, search as vector_search, warmup as vector_warmup, prefetch as vector_prefetch
+from .retrieval import hybrid_search, hybrid_search_batch
+from .law_guides import get_engine as get_guide_engine
+from .reranker import start_warmup as reranker_warmup
 from .query_rewrite import rewrite as rewrite_query
 from .rules import resolve_topic
-from .citations import decorate_citation
+from .citations import decorate_citations
 from .articles import find_article
 from .database import get_db
 from .query_classifier import classify_query, INFO, PROFESSIONAL
@@ -36,6 +55,9 @@ from .query_enhancement import get_query_enhancer, is_available as qe_available
 from .multi_agent_coordinator import MultiAgentCoordinator, MultiAgentRequest, MultiAgentResponse
 # 🆕 Phase 2.5: Intelligent Retrieval
 from .intelligent_retrieval import get_intelligent_retriever, is_available as ir_available
+# 🆕 Phase 2.6: Query Planner
+from .query_planner import QueryPlanner, multi_path_retrieval
+import asyncio
 import time
 from datetime import datetime
 import uuid
@@ -45,9 +67,25 @@ ROOT = Path(__file__).resolve().parents[1]
 STATIC_DIR = ROOT / "static"
 API_KEY_PATH = ROOT / "api key.txt"
 
+# Query errors go through a queue so traceback formatting and stderr writes
+# happen on the listener thread, not the request thread.
+logger = logging.getLogger("query")
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+logger.setLevel(logging.INFO)
+logger.propagate = False
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+
+_OPENAI_MARKER_RE = re.compile(r"^[^\n]*openai[^\n]*\n\s*(\S[^\n]*?)\s*$", re.IGNORECASE | re.MULTILINE)
+_SK_LINE_RE = re.compile(r"^\s*((?:sk-|sk_projec)[^\n]*?)\s*$", re.MULTILINE)
+
 
+@lru_cache(maxsize=1)
 def read_api_key() -> Optional[str]:
-    """Read OpenAI API key from file or environment"""
+    """Read OpenAI API key from file or environment (cached for the process lifetime)"""
     # Prefer environment variable if present
     env_key = os.environ.get("OPENAI_API_KEY")
     if env_key and env_key.strip():
@@ -56,27 +94,42 @@ def read_api_key() -> Optional[str]:
         if not API_KEY_PATH.exists():
             return None
         content = API_KEY_PATH.read_text(encoding="utf-8")
-        lines = [ln.strip() for ln in content.splitlines() if ln.strip()]
-        # Heuristic 1: find a line after a marker containing 'openai'
-        for i, ln in enumerate(lines):
-            if "openai" in ln.lower() and i + 1 < len(lines):
-                cand = lines[i + 1]
-                if cand.startswith(("sk-", "sk_projec", "sk-proj-")):
-                    return cand
-                # otherwise still return the next line as a candidate
-                return cand
+        # Heuristic 1: the next non-empty line after a marker containing 'openai'
+        m = _OPENAI_MARKER_RE.search(content)
+        if m:
+            return m.group(1)
         # Heuristic 2: first line that looks like an OpenAI key
-        for ln in lines:
-            if ln.startswith(("sk-", "sk_projec", "sk-proj-")):
-                return ln
+        m = _SK_LINE_RE.search(content)
+        if m:
+            return m.group(1)
         # Fallback: single token file
-        if len(lines) == 1:
-            return lines[0]
+        token = content.strip()
+        if token and len(token.splitlines()) == 1:
+            return token
     except Exception:
         return None
     return None
 
 
+def _orjson_default(obj):
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson when installed (stdlib json otherwise)."""
+
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(
+            content,
+            default=_orjson_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+        )
+
+
 app = FastAPI(title="Taiwan Labor RAG API", version="0.1.0")
 
 # Initialize database & guards
@@ -88,7 +141,7 @@ validator = CitationValidator()
 try:
     if kg_available():
         kg = get_knowledge_graph()
-        print(f"[Phase 2] Knowledge Graph loaded: {len(kg.entities)} entities, {kg.graph.number_of_edges()} relations")
+        print(f"[Phase 2] Knowledge Graph loaded: {len(kg.entities)} entities, {kg.num_edges} relations")
     else:
         kg = None
         print("[Phase 2] Knowledge Graph not available")
@@ -124,7 +177,6 @@ query_planner = None
 try:
     api_key = read_api_key()
     if api_key:
-        from .query_planner import QueryPlanner
         query_planner = QueryPlanner(api_key=api_key, model="gpt-5-mini")
         print("[Phase 2.6] Query Planner initialized")
     else:
@@ -132,6 +184,14 @@ try:
 except Exception as e:
     print(f"[Phase 2.6] Failed to initialize Query Planner: {e}")
 
+# Phase 3: shared multi-agent coordinator (agents hold no per-request state)
+coordinator = None
+try:
+    coordinator = MultiAgentCoordinator(query_planner=query_planner, query_enhancer=query_enhancer)
+    print("[Phase 3] Multi-Agent Coordinator initialized")
+except Exception as e:
+    print(f"[Phase 3] Failed to initialize Multi-Agent Coordinator: {e}")
+
 # In-memory metrics (for real-time tracking, periodically synced to DB)
 METRICS = {
     "total_queries": 0,
@@ -139,6 +199,62 @@ METRICS = {
     "total_citations": 0,
     "start_time": datetime.now().isoformat()
 }
+_METRICS_LOCK = threading.Lock()
+
+# /metrics 的資料庫計數快取秒數（避免每次抓取都 COUNT(*) 全表）
+METRICS_DB_TTL = 5
+
+
+def _record_query_metrics(latency_seconds: float, num_citations: int) -> None:
+    with _METRICS_LOCK:
+        METRICS["total_queries"] += 1
+        METRICS["total_latency"] += latency_seconds
+        METRICS["total_citations"] += num_citations
+
+
+@lru_cache(maxsize=1)
+def _db_counts(time_bucket: int) -> tuple[int, int, int]:
+    """(sessions, feedbacks, user messages); ``time_bucket`` rotates the cache every METRICS_DB_TTL s."""
+    with db.get_conn() as conn:
+        total_sessions = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        total_feedbacks = conn.execute("SELECT COUNT(*) FROM feedback").fetchone()[0]
+        total_messages = conn.execute("SELECT COUNT(*) FROM messages WHERE role='user'").fetchone()[0]
+    return total_sessions, total_feedbacks, total_messages
+
+# Shared, bounded pool for every asyncio.to_thread / wait_for-timed blocking call in the
+# request path: threads are reused instead of spawned per call, and load spikes queue
+# here rather than fanning out into unbounded threads. Timed-out work finishes in the background.
+BLOCKING_POOL_WORKERS = 16
+_blocking_pool = ThreadPoolExecutor(max_workers=BLOCKING_POOL_WORKERS, thread_name_prefix="query-worker")
+atexit.register(_blocking_pool.shutdown, wait=False)
+
+
+async def warmup_singletons(api_key: Optional[str] = None) -> None:
+    """
+    Load lazily-initialized singletons concurrently at startup,
+    so the first user request does not pay file-parse / graph-build / client-init cost.
+    """
+    tasks = [
+        asyncio.to_thread(get_knowledge_graph),
+        asyncio.to_thread(get_guide_engine),
+        asyncio.to_thread(load_index),
+        asyncio.to_thread(vector_prefetch),
+    ]
+    if api_key and ir_available():
+        tasks.append(asyncio.to_thread(get_intelligent_retriever, api_key, "gpt-5-mini"))
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"[Warmup] Singleton warmup failed: {result}")
+
+
+@app.on_event("startup")
+async def _startup_warmup():
+    asyncio.get_running_loop().set_default_executor(_blocking_pool)
+    # Reranker 模型載入可能需數秒至數十秒：背景進行，不阻擋服務啟動
+    reranker_warmup()
+    await warmup_singletons(read_api_key())
+
 
 # CORS for local dev
 app.add_middleware(
@@ -150,6 +266,7 @@ app.add_middleware(
 )
 
 
+@lru_cache(maxsize=1)
 def read_openai_base_url() -> Optional[str]:
     url = os.environ.get("OPENAI_BASE_URL")
     if url and url.strip():
@@ -157,6 +274,7 @@ def read_openai_base_url() -> Optional[str]:
     return None
 
 
+@lru_cache(maxsize=1)
 def read_openai_org_project() -> tuple[Optional[str], Optional[str]]:
     org = os.environ.get("OPENAI_ORG_ID") or os.environ.get("OPENAI_ORGANIZATION")
     proj = os.environ.get("OPENAI_PROJECT_ID") or os.environ.get("OPENAI_PROJECT")
@@ -165,32 +283,68 @@ def read_openai_org_project() -> tuple[Optional[str], Optional[str]]:
     return org, proj
 
 
-def _run_with_timeout(func, timeout: float, *args, **kwargs):
-    """Run blocking operations with a soft timeout."""
-    with ThreadPoolExecutor(max_workers=1) as executor:
-        future = executor.submit(func, *args, **kwargs)
-        return future.result(timeout=timeout)
+@lru_cache(maxsize=1)
+def get_openai_client():
+    """Process-wide OpenAI client, so its connection pool stays warm across requests."""
+    org, proj = read_openai_org_project()
+    return OpenAI(api_key=read_api_key(), base_url=read_openai_base_url(), organization=org, project=proj)
+
+
+@lru_cache(maxsize=1)
+def get_async_openai_client():
+    """Process-wide AsyncOpenAI client used by the async endpoints (keep-alive pooled)."""
+    org, proj = read_openai_org_project()
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+        timeout=httpx.Timeout(120.0, connect=10.0),
+    )
+    return AsyncOpenAI(
+        api_key=read_api_key(),
+        base_url=read_openai_base_url(),
+        organization=org,
+        project=proj,
+        http_client=http_client,
+    )
+
+
+def _results_to_dicts(results) -> List[dict]:
+    """Convert hybrid_search (score, meta) rows into the citation dicts used downstream."""
+    out = []
+    append = out.append
+    for _, meta in results:
+        get = meta.get
+        law_id = get("law_id")
+        append({
+            "law_name": law_id,
+            "law_id": law_id,
+            "article_no": get("article_no", "").strip(),
+            "heading": get("heading"),
+            "text": get("text"),
+            "source_file": get("source_file", ""),
+            "chapter": get("chapter", ""),
+        })
+    return out
 
 
 def _missing_required_laws(query_plan, retrieval_results: List[dict]) -> List[str]:
     if not query_plan:
         return []
+    required = query_plan.required_laws
+    if not required:
+        return []
     seen = {
         (item.get("law_name") or item.get("law_id"))
         for item in retrieval_results
         if item.get("law_name") or item.get("law_id")
     }
-    missing = [
-        law for law in getattr(query_plan, "required_laws", []) or []
-        if law and law not in seen
-    ]
+    missing = [law for law in required if law and law not in seen]
     return missing
 
 
 def _should_use_iterative(query_plan, retrieval_results: List[dict], top_k: int) -> bool:
     if not query_plan or not retrieval_results:
         return True
-    difficulty = (getattr(query_plan, "estimated_difficulty", "") or "medium").lower()
+    difficulty = (query_plan.estimated_difficulty or "medium").lower()
     if difficulty == "complex":
         return True
     if len(retrieval_results) < max(top_k, 5):
@@ -203,11 +357,16 @@ def _should_use_iterative(query_plan, retrieval_results: List[dict], top_k: int)
 def _prepend_forced_articles(query_plan, retrieval_results: List[dict]) -> List[dict]:
     if not query_plan:
         return retrieval_results
-    forced_articles = getattr(query_plan, "_forced_articles", [])
+    forced_articles = query_plan._forced_articles
     if not forced_articles:
         return retrieval_results
 
-    remaining = list(retrieval_results)
+    # (law_name, article_no) -> indices in retrieval order, so each forced article
+    # claims the first unclaimed match with one hash lookup instead of a scan
+    positions: dict = {}
+    for idx, item in enumerate(retrieval_results):
+        positions.setdefault((item.get("law_name"), item.get("article_no")), []).append(idx)
+    taken = set()
     forced_entries: List[dict] = []
 
     def _make_entry(law_name: str, article_no: str) -> Optional[dict]:
@@ -227,13 +386,11 @@ def _prepend_forced_articles(query_plan, retrieval_results: List[dict]) -> List[
         }
 
     for law_name, article_no in forced_articles:
-        existing_idx = next(
-            (idx for idx, item in enumerate(remaining)
-             if item.get("law_name") == law_name and item.get("article_no") == article_no),
-            None
-        )
-        if existing_idx is not None:
-            entry = remaining.pop(existing_idx)
+        indices = positions.get((law_name, article_no))
+        if indices:
+            existing_idx = indices.pop(0)
+            taken.add(existing_idx)
+            entry = retrieval_results[existing_idx]
             entry["forced_article"] = True
             entry["source"] = entry.get("source") or "query_plan_forced"
         else:
@@ -242,6 +399,7 @@ def _prepend_forced_articles(query_plan, retrieval_results: List[dict]) -> List[
                 continue
         forced_entries.append(entry)
 
+    remaining = [item for idx, item in enumerate(retrieval_results) if idx not in taken]
     return forced_entries + remaining
 
 
@@ -289,175 +447,197 @@ class CitationErrorReport(BaseModel):
     article_no: Optional[str] = None
 
 
-@app.get("/health")
+@app.get("/health", response_class=ORJSONResponse)
 def health():
     idx = load_index()
     return {"status": "ok", "num_docs": idx["meta"]["num_docs"]}
 
 
-@app.get("/warmup")
+@app.get("/warmup", response_class=ORJSONResponse)
 def warmup():
     info = vector_warmup()
-    return {"status": "ok", "vector": info}
+    prefetched = vector_prefetch()
+    return {"status": "ok", "vector": info, "prefetched_bytes": prefetched}
 
 
-@app.get("/article")
+@app.get("/article", response_class=ORJSONResponse)
 def get_article(law: str, no: str):
     """Direct lookup: /article?law=勞動基準法&no=32"""
     result = find_article(law, no)
     if not result:
-        return JSONResponse({"found": False, "message": "找不到對應條文"}, status_code=404)
+        return ORJSONResponse({"found": False, "message": "找不到對應條文"}, status_code=404)
     return {"found": True, **result}
 
 
-@app.post("/query", response_model=QueryResponse)
-def query(req: QueryRequest):
+@dataclass
+class _PreparedQuery:
+    """Conversation history and retrieval results shared by /query and /query/stream."""
+    start_time: float
+    conversation_history: List[dict]
+    topic: Optional[object]
+    rewritten_q: str
+    used_hyde: bool
+    query_plan: Optional[object]
+    query_plan_main_issue: Optional[str]
+    query_plan_sub_issues_count: int
+    multipath_results_count: int
+    used_intelligent_retrieval: bool
+    ir_iterations: int
+    ir_forced_articles: int
+    ir_insufficient_warning: str
+    citations_for_llm: List[dict]
+
+
+async def _load_conversation_history(session_id: Optional[str]) -> List[dict]:
+    # 🆕 對話記憶：讀取最近的對話歷史（最多 5 輪）
+    conversation_history = []
+    if session_id:
+        try:
+            messages = await asyncio.to_thread(db.get_session_messages, session_id)
+            # 取最近 5 輪對話（10 條訊息：5 個問題 + 5 個回答）
+            recent_messages = messages[-10:] if len(messages) > 10 else messages
+            for msg in recent_messages:
+                role = "user" if msg["role"] == "user" else "assistant"
+                conversation_history.append({
+                    "role": role,
+                    "content": msg["content"]
+                })
+            if conversation_history:
+                print(f"[對話記憶] 讀取 {len(conversation_history)} 條歷史訊息")
+        except Exception as e:
+            print(f"[對話記憶] 讀取失敗: {e}")
+    return conversation_history
+
+
+async def _hyde_search_query(query: str) -> tuple[str, bool]:
+    # 🆕 Phase 2: Query Enhancement (HyDE for abstract queries)
+    if query_enhancer and query_enhancer.should_use_hyde(query):
+        try:
+            hypothetical_doc = await asyncio.to_thread(query_enhancer.generate_hypothetical_document, query)
+            print(f"[Phase 2] Using HyDE for abstract query")
+            return hypothetical_doc, True
+        except Exception as e:
+            print(f"[Phase 2] HyDE failed, using original query: {e}")
+    return query, False
+
+
+def _kg_metadata(query: str) -> tuple[Optional[str], Optional[str]]:
+    """🆕 Phase 2: KG scenario name and reasoning (independent of retrieval)."""
+    if not kg:
+        return None, None
     try:
-        start_time = time.time()
-        
-        # 🆕 對話記憶：讀取最近的對話歷史（最多 5 輪）
-        conversation_history = []
-        if req.session_id:
-            try:
-                messages = db.get_session_messages(req.session_id)
-                # 取最近 5 輪對話（10 條訊息：5 個問題 + 5 個回答）
-                recent_messages = messages[-10:] if len(messages) > 10 else messages
-                for msg in recent_messages:
-                    role = "user" if msg["role"] == "user" else "assistant"
-                    conversation_history.append({
-                        "role": role,
-                        "content": msg["content"]
-                    })
-                if conversation_history:
-                    print(f"[對話記憶] 讀取 {len(conversation_history)} 條歷史訊息")
-            except Exception as e:
-                print(f"[對話記憶] 讀取失敗: {e}")
-        
-        # 🔴 Phase 0: Get topic for whitelist enforcement
-        topic = resolve_topic(req.query)
+        scenario = kg.match_scenario(query)
+        if scenario:
+            return scenario.get("name"), kg.get_scenario_reasoning(query)
+    except Exception:
+        pass
+    return None, None
 
-        # 🆕 Phase 2: Query Enhancement (HyDE for abstract queries)
-        search_query = req.query
-        used_hyde = False
-        if query_enhancer and query_enhancer.should_use_hyde(req.query):
-            try:
-                hypothetical_doc = query_enhancer.generate_hypothetical_document(req.query)
-                search_query = hypothetical_doc
-                used_hyde = True
-                print(f"[Phase 2] Using HyDE for abstract query")
-            except Exception as e:
-                print(f"[Phase 2] HyDE failed, using original query: {e}")
-                search_query = req.query
 
-        # Rewrite query
-        rewritten_q = rewrite_query(search_query)
-        
-        # 🆕 Phase 2.6: Query Planner + Multi-Path Retrieval
-        query_plan = None
-        query_plan_main_issue = None
-        query_plan_sub_issues_count = 0
-        multipath_results_count = 0
-        used_intelligent_retrieval = False
-        ir_iterations = 0
-        ir_forced_articles = 0
-        ir_insufficient_warning = ""
-        
-        if req.use_intelligent_retrieval and query_planner:
-            try:
-                print(f"[Phase 2.6] 啟用智能查詢規劃 + 多路徑檢索模式")
-                
-                # 第一步：LLM 分析問題並規劃檢索策略
-                query_plan = query_planner.plan_query(req.query)
-                query_plan_main_issue = query_plan.main_issue
-                query_plan_sub_issues_count = len(query_plan.sub_issues)
-                print(f"[Phase 2.6] Forced articles: {getattr(query_plan, '_forced_articles', [])}")
-                
-                print(f"[Phase 2.6] 查詢計畫: {query_plan.main_issue}")
-                print(f"[Phase 2.6] 子問題數: {query_plan_sub_issues_count}")
-                
-                # 第二步：多路徑並行檢索
-                from .query_planner import multi_path_retrieval
-                
-                multipath_results = multi_path_retrieval(
-                    query=req.query,
-                    query_plan=query_plan,
-                    hybrid_search_func=hybrid_search,
-                    rewritten_query=rewritten_q,
-                    top_k=req.top_k * 2,  # 每個路徑檢索較多結果
-                    use_rerank=req.use_rerank
-                )
-                
-                multipath_results_count = len(multipath_results)
-                print(f"[Phase 2.6] 多路徑檢索結果: {multipath_results_count} 條")
-                
-                # 第三步（可選）：如果啟用 2.5 迭代檢索，進一步補強
-                use_iterative = bool(intelligent_retriever) and _should_use_iterative(query_plan, multipath_results, req.top_k)
-                if use_iterative:
-                    try:
-                        print(f"[Phase 2.6] Running Phase 2.5 iterative reinforcement")
-                        
-                        # Phase 2.5 pre-analysis
-                        pre_analysis = _run_with_timeout(intelligent_retriever.pre_analyze, 8, req.query)
-                        
-                        # Iterative retrieval to fill gaps
-                        enhanced_results = _run_with_timeout(
+async def _prepare_query(req: QueryRequest) -> _PreparedQuery:
+    start_time = time.time()
+    
+    # 對話歷史、HyDE 與查詢規劃都只依賴原始問題，同時啟動以重疊等待時間
+    plan_task = None
+    if req.use_intelligent_retrieval and query_planner:
+        plan_task = asyncio.ensure_future(query_planner.aplan_query(req.query))
+    conversation_history, (search_query, used_hyde) = await asyncio.gather(
+        _load_conversation_history(req.session_id),
+        _hyde_search_query(req.query),
+    )
+    
+    # 🔴 Phase 0: Get topic for whitelist enforcement
+    topic = resolve_topic(req.query)
+
+    # Rewrite query
+    rewritten_q = rewrite_query(search_query)
+    
+    # 🆕 Phase 2.6: Query Planner + Multi-Path Retrieval
+    query_plan = None
+    query_plan_main_issue = None
+    query_plan_sub_issues_count = 0
+    multipath_results_count = 0
+    used_intelligent_retrieval = False
+    ir_iterations = 0
+    ir_forced_articles = 0
+    ir_insufficient_warning = ""
+    
+    if plan_task is not None:
+        try:
+            print(f"[Phase 2.6] 啟用智能查詢規劃 + 多路徑檢索模式")
+            
+            # 第一步：LLM 分析問題並規劃檢索策略（已與 HyDE 同時啟動）
+            query_plan = await plan_task
+            query_plan_main_issue = query_plan.main_issue
+            query_plan_sub_issues_count = len(query_plan.sub_issues)
+            print(f"[Phase 2.6] Forced articles: {query_plan._forced_articles}")
+            
+            print(f"[Phase 2.6] 查詢計畫: {query_plan.main_issue}")
+            print(f"[Phase 2.6] 子問題數: {query_plan_sub_issues_count}")
+            
+            # 第二步：多路徑並行檢索
+            multipath_results = await asyncio.to_thread(
+                multi_path_retrieval,
+                query=req.query,
+                query_plan=query_plan,
+                hybrid_search_func=hybrid_search,
+                rewritten_query=rewritten_q,
+                top_k=req.top_k * 2,  # 每個路徑檢索較多結果
+                use_rerank=req.use_rerank,
+                hybrid_search_batch_func=hybrid_search_batch
+            )
+            
+            multipath_results_count = len(multipath_results)
+            print(f"[Phase 2.6] 多路徑檢索結果: {multipath_results_count} 條")
+            
+            # 第三步（可選）：如果啟用 2.5 迭代檢索，進一步補強
+            use_iterative = bool(intelligent_retriever) and _should_use_iterative(query_plan, multipath_results, req.top_k)
+            if use_iterative:
+                try:
+                    print(f"[Phase 2.6] Running Phase 2.5 iterative reinforcement")
+                    
+                    # Phase 2.5 pre-analysis
+                    pre_analysis = await asyncio.wait_for(
+                        asyncio.to_thread(intelligent_retriever.pre_analyze, req.query),
+                        timeout=8,
+                    )
+                    
+                    # Iterative retrieval to fill gaps
+                    enhanced_results = await asyncio.wait_for(
+                        asyncio.to_thread(
                             intelligent_retriever.iterative_retrieve,
-                            15,
                             req.query,
                             pre_analysis,
                             multipath_results,
-                        )
-                        
-                        ir_iterations = getattr(intelligent_retriever, "last_iterations", 0)
-                        ir_forced_articles = getattr(intelligent_retriever, "last_forced_additions", 0)
-                        
-                        print(f"[Phase 2.6] 2.5 iterations: {ir_iterations} rounds, forced {ir_forced_articles} articles")
-                        
-                        validated_results = enhanced_results[:req.top_k * 2]
-                        
-                    except FuturesTimeoutError:
-                        print(f"[Phase 2.6] 2.5 reinforcement timed out, fallback to multi-path results")
-                        validated_results = multipath_results[:req.top_k * 2]
-                    except Exception as e:
-                        print(f"[Phase 2.6] 2.5 reinforcement failed, fallback to multi-path results: {e}")
-                        validated_results = multipath_results[:req.top_k * 2]
-                else:
+                        ),
+                        timeout=15,
+                    )
+                    
+                    ir_iterations = intelligent_retriever.last_iterations
+                    ir_forced_articles = intelligent_retriever.last_forced_additions
+                    
+                    print(f"[Phase 2.6] 2.5 iterations: {ir_iterations} rounds, forced {ir_forced_articles} articles")
+                    
+                    validated_results = enhanced_results[:req.top_k * 2]
+                    
+                except asyncio.TimeoutError:
+                    print(f"[Phase 2.6] 2.5 reinforcement timed out, fallback to multi-path results")
                     validated_results = multipath_results[:req.top_k * 2]
-                
-                used_intelligent_retrieval = bool(use_iterative)
-                print(f"[Phase 2.6] ✓ Intelligent retrieval finalized, total results: {len(validated_results)}")
-                
-            except Exception as e:
-                print(f"[Phase 2.6] ✗ 智能檢索失敗，降級到 2.0: {e}")
-                import traceback
-                traceback.print_exc()
-                
-                # 降級到 2.0 模式
-                results = hybrid_search(
-                    rewritten_q,
-                    top_k=req.top_k,
-                    use_rerank=req.use_rerank,
-                    preferred_laws=topic.preferred_laws if topic else None,
-                    blocked_laws=topic.blocked_laws if topic else None,
-                    prior_articles=topic.prior_articles if topic else None,
-                )
-                
-                # 轉換為 dict 格式
-                validated_results = [
-                    {
-                        "law_name": r[1].get("law_id"),
-                        "law_id": r[1].get("law_id"),
-                        "article_no": r[1].get("article_no", "").strip(),
-                        "heading": r[1].get("heading"),
-                        "text": r[1].get("text"),
-                        "source_file": r[1].get("source_file", ""),
-                        "chapter": r[1].get("chapter", "")
-                    }
-                    for r in results
-                ]
-        else:
-            # 2.0 模式（原有邏輯）
-            results = hybrid_search(
+                except Exception as e:
+                    print(f"[Phase 2.6] 2.5 reinforcement failed, fallback to multi-path results: {e}")
+                    validated_results = multipath_results[:req.top_k * 2]
+            else:
+                validated_results = multipath_results[:req.top_k * 2]
+            
+            used_intelligent_retrieval = bool(use_iterative)
+            print(f"[Phase 2.6] ✓ Intelligent retrieval finalized, total results: {len(validated_results)}")
+            
+        except Exception as e:
+            logger.exception("[Phase 2.6] ✗ 智能檢索失敗，降級到 2.0: %s", e)
+            
+            # 降級到 2.0 模式
+            results = await asyncio.to_thread(
+                hybrid_search,
                 rewritten_q,
                 top_k=req.top_k,
                 use_rerank=req.use_rerank,
@@ -465,60 +645,91 @@ def query(req: QueryRequest):
                 blocked_laws=topic.blocked_laws if topic else None,
                 prior_articles=topic.prior_articles if topic else None,
             )
-            validated_results = [
-                {
-                    "law_name": r[1].get("law_id"),
-                    "law_id": r[1].get("law_id"),
-                    "article_no": r[1].get("article_no", "").strip(),
-                    "heading": r[1].get("heading"),
-                    "text": r[1].get("text"),
-                    "source_file": r[1].get("source_file", ""),
-                    "chapter": r[1].get("chapter", "")
-                }
-                for r in results
-            ]
-
-        validated_results = validator.enforce_whitelist(
-            req.query,
-            topic.name if topic else None,
-            validated_results
+            
+            # 轉換為 dict 格式
+            validated_results = _results_to_dicts(results)
+    else:
+        # 2.0 模式（原有邏輯）
+        results = await asyncio.to_thread(
+            hybrid_search,
+            rewritten_q,
+            top_k=req.top_k,
+            use_rerank=req.use_rerank,
+            preferred_laws=topic.preferred_laws if topic else None,
+            blocked_laws=topic.blocked_laws if topic else None,
+            prior_articles=topic.prior_articles if topic else None,
         )
-        validated_results = _prepend_forced_articles(query_plan, validated_results)
-        citations_for_llm = validated_results[:req.top_k]
+        validated_results = _results_to_dicts(results)
+
+    validated_results = validator.enforce_whitelist(
+        req.query,
+        topic.name if topic else None,
+        validated_results
+    )
+    validated_results = await asyncio.to_thread(_prepend_forced_articles, query_plan, validated_results)
+    citations_for_llm = validated_results[:req.top_k]
+
+    return _PreparedQuery(
+        start_time=start_time,
+        conversation_history=conversation_history,
+        topic=topic,
+        rewritten_q=rewritten_q,
+        used_hyde=used_hyde,
+        query_plan=query_plan,
+        query_plan_main_issue=query_plan_main_issue,
+        query_plan_sub_issues_count=query_plan_sub_issues_count,
+        multipath_results_count=multipath_results_count,
+        used_intelligent_retrieval=used_intelligent_retrieval,
+        ir_iterations=ir_iterations,
+        ir_forced_articles=ir_forced_articles,
+        ir_insufficient_warning=ir_insufficient_warning,
+        citations_for_llm=citations_for_llm,
+    )
+
+
+def _build_llm_messages(req: QueryRequest, citations_for_llm: List[dict], conversation_history: List[dict]) -> List[dict]:
+    # Assemble context for LLM
+    context = "\n\n".join([
+        f"[來源: {c['law_name']} | {c['heading']}]\n{c['text']}" for c in citations_for_llm
+    ])
+
+    # Classify query and get prompt
+    q_type = classify_query(req.query)
+    system_prompt, user_message = get_prompt(q_type, req.query, context)
+    
+    # 🆕 構建對話式訊息序列
+    messages = [{"role": "system", "content": system_prompt}]
+    
+    # 加入對話歷史
+    if conversation_history:
+        messages.extend(conversation_history)
+        # 當前問題作為最新的 user 訊息
+        messages.append({"role": "user", "content": user_message})
+    else:
+        # 沒有歷史，直接使用原始 prompt
+        messages.append({"role": "user", "content": user_message})
+    return messages
+
+
+@app.post("/query", response_model=QueryResponse)
+async def query(req: QueryRequest):
+    kg_task = None
+    try:
+        prepared = await _prepare_query(req)
+        citations_for_llm = prepared.citations_for_llm
+        if req.use_llm and not read_api_key():
+            return ORJSONResponse(status_code=400, content={"error": "API key is not configured."})
+        # KG 情境比對與 LLM 生成 / 驗證互不相依，先在背景執行（提前返回時於 finally 取消）
+        kg_task = asyncio.ensure_future(asyncio.to_thread(_kg_metadata, req.query))
 
         answer = None
         if req.use_llm:
-            api_key = read_api_key()
-            if not api_key:
-                return JSONResponse(status_code=400, content={"error": "API key is not configured."})
-            
             try:
-                from openai import OpenAI
-                org, proj = read_openai_org_project()
-                client = OpenAI(api_key=api_key, base_url=read_openai_base_url(), organization=org, project=proj)
-
-                # Assemble context for LLM
-                context = "\n\n".join([
-                    f"[來源: {c['law_name']} | {c['heading']}]\n{c['text']}" for c in citations_for_llm
-                ])
-
-                # Classify query and get prompt
-                q_type = classify_query(req.query)
-                system_prompt, user_message = get_prompt(q_type, req.query, context)
-                
-                # 🆕 構建對話式訊息序列
-                messages = [{"role": "system", "content": system_prompt}]
-                
-                # 加入對話歷史
-                if conversation_history:
-                    messages.extend(conversation_history)
-                    # 當前問題作為最新的 user 訊息
-                    messages.append({"role": "user", "content": user_message})
-                else:
-                    # 沒有歷史，直接使用原始 prompt
-                    messages.append({"role": "user", "content": user_message})
+                client = get_async_openai_client()
+
+                messages = _build_llm_messages(req, citations_for_llm, prepared.conversation_history)
                 
-                resp = client.chat.completions.create(
+                resp = await client.chat.completions.create(
                     model="gpt-5-mini",
                     messages=messages,
                     temperature=0.7,
@@ -526,95 +737,202 @@ def query(req: QueryRequest):
                 answer = resp.choices[0].message.content
                 
                 # 🆕 Phase 2.5: 加入智能檢索的警告訊息
-                if ir_insufficient_warning:
-                    answer += ir_insufficient_warning
+                if prepared.ir_insufficient_warning:
+                    answer += prepared.ir_insufficient_warning
 
             except Exception as e:
-                return JSONResponse(status_code=500, content={"error": f"LLM generation failed: {e}"})
+                return ORJSONResponse(status_code=500, content={"error": f"LLM generation failed: {e}"})
 
         # 🔴 Phase 0: Layers 2-4 - Full Validation
-        validation_report = validator.validate_all(req.query, citations_for_llm, topic.name if topic else None)
+        validation_report = await asyncio.to_thread(
+            validator.validate_all, req.query, citations_for_llm, prepared.topic.name if prepared.topic else None
+        )
         
-        # 🆕 對話記憶：先保存用戶問題（無論驗證是否通過）
-        if req.session_id:
-            try:
-                db.add_message(req.session_id, "user", req.query)
-                print(f"[對話記憶] 已保存用戶問題到 session {req.session_id}")
-            except Exception as e:
-                print(f"[對話記憶] 保存用戶問題失敗: {e}")
+        # 🆕 對話記憶：用戶問題（無論驗證是否通過）與系統回應於回應送出後一次寫入
+        session_messages = [("user", req.query)]
         
         # Handle validation actions
         if validation_report['action'] == 'BLOCK':
             # 保存系統的錯誤回應
-            if req.session_id:
-                try:
-                    error_msg = "引用驗證失敗，系統無法提供可信回答。建議諮詢專業律師或聯繫勞動主管機關。"
-                    db.add_message(req.session_id, "assistant", error_msg)
-                except Exception as e:
-                    print(f"[對話記憶] 保存錯誤回應失敗: {e}")
-            return JSONResponse(
+            session_messages.append(("assistant", BLOCKED_MESSAGE))
+            return ORJSONResponse(
                 status_code=400, 
                 content={
                     "error": "引用驗證失敗，系統無法提供可信回答",
                     "details": validation_report['errors'],
                     "suggestion": "建議諮詢專業律師或聯繫勞動主管機關",
                     "status": "BLOCKED"
-                }
+                },
+                background=BackgroundTask(_save_session_messages, req.session_id, session_messages),
             )
         
         if validation_report['action'] == 'WARN' and answer:
             answer += "\n\n⚠️ **引用提醒**：\n" + "\n".join(validation_report['warnings'])
 
         end_time = time.time()
-        latency = (end_time - start_time) * 1000  # ms
+        latency = (end_time - prepared.start_time) * 1000  # ms
+        _record_query_metrics(latency / 1000, len(citations_for_llm))
 
         # Format final citations
-        final_citations = [decorate_citation(c) for c in citations_for_llm]
+        final_citations = decorate_citations(citations_for_llm)
         
         # 🆕 Phase 2: Get KG metadata if available
-        kg_scenario_name = None
-        kg_reasoning_text = None
-        if kg:
-            try:
-                scenario = kg.match_scenario(req.query)
-                if scenario:
-                    kg_scenario_name = scenario.get("name")
-                    kg_reasoning_text = kg.get_scenario_reasoning(req.query)
-            except Exception:
-                pass
-
-        # 🆕 對話記憶：保存系統回答（用戶問題已在上面保存）
-        if req.session_id and answer:
-            try:
-                db.add_message(req.session_id, "assistant", answer)
-                print(f"[對話記憶] 已保存系統回答到 session {req.session_id}")
-            except Exception as e:
-                print(f"[對話記憶] 保存系統回答失敗: {e}")
+        kg_scenario_name, kg_reasoning_text = await kg_task
 
-        return QueryResponse(
+        # 🆕 對話記憶：保存系統回答
+        if answer:
+            session_messages.append(("assistant", answer))
+
+        # 回傳已組好的 dict（欄位同 QueryResponse），略過 Pydantic 逐欄驗證 citations
+        return ORJSONResponse(dict(
             answer=answer,
             citations=final_citations,
             used_llm=req.use_llm,
-            normalized_query=(rewritten_q if rewritten_q != req.query else None),
+            normalized_query=(prepared.rewritten_q if prepared.rewritten_q != req.query else None),
             validation=validation_report,
-            used_hyde=used_hyde,
+            used_hyde=prepared.used_hyde,
             kg_scenario=kg_scenario_name,
             kg_reasoning=kg_reasoning_text,
-            used_intelligent_retrieval=used_intelligent_retrieval,
-            ir_iterations=ir_iterations,
-            ir_forced_articles=ir_forced_articles,
-            query_plan_main_issue=query_plan_main_issue,
-            query_plan_sub_issues=query_plan_sub_issues_count,
-            multipath_results_count=multipath_results_count
-        )
+            used_intelligent_retrieval=prepared.used_intelligent_retrieval,
+            ir_iterations=prepared.ir_iterations,
+            ir_forced_articles=prepared.ir_forced_articles,
+            query_plan_main_issue=prepared.query_plan_main_issue,
+            query_plan_sub_issues=prepared.query_plan_sub_issues_count,
+            multipath_results_count=prepared.multipath_results_count
+        ), background=BackgroundTask(_save_session_messages, req.session_id, session_messages))
     except Exception as e:
-        print(f"[ERROR] Query failed: {e}")
-        import traceback
-        traceback.print_exc()
-        return JSONResponse(
+        logger.exception("[ERROR] Query failed: %s", e)
+        return ORJSONResponse(
             status_code=500,
             content={"error": f"Query processing failed: {str(e)}"}
         )
+    finally:
+        if kg_task is not None and not kg_task.done():
+            kg_task.cancel()
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Events frame."""
+    payload = orjson.dumps(data).decode("utf-8") if orjson else json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+BLOCKED_MESSAGE = "引用驗證失敗，系統無法提供可信回答。建議諮詢專業律師或聯繫勞動主管機關。"
+
+
+def _save_session_messages(session_id: Optional[str], messages: List[tuple]) -> None:
+    """Persist one exchange in a single transaction, after the response has been sent."""
+    if not session_id or not messages:
+        return
+    try:
+        db.add_messages_bulk(session_id, messages)
+        print(f"[對話記憶] 已保存 {len(messages)} 則訊息到 session {session_id}")
+    except Exception as e:
+        print(f"[對話記憶] 保存訊息失敗: {e}")
+
+
+def _save_stream_messages(session_id: Optional[str], user_query: str, answer_parts: List[str]) -> None:
+    """Persist a streamed exchange once the client has received it."""
+    answer = "".join(answer_parts)
+    messages = [("user", user_query)]
+    if answer:
+        messages.append(("assistant", answer))
+    _save_session_messages(session_id, messages)
+
+
+@app.post("/query/stream")
+async def query_stream(req: QueryRequest):
+    """
+    串流版 /query（Server-Sent Events）
+
+    事件順序：citations（檢索完成即送出）→ delta（LLM 逐段輸出）→ done。
+    引用驗證在 LLM 之前完成，BLOCK 時直接回傳 400；對話記錄於串流結束後寫入。
+    """
+    api_key = read_api_key()
+    if not api_key:
+        return ORJSONResponse(status_code=400, content={"error": "API key is not configured."})
+
+    try:
+        prepared = await _prepare_query(req)
+        citations_for_llm = prepared.citations_for_llm
+        topic_name = prepared.topic.name if prepared.topic else None
+        validation_report = await asyncio.to_thread(
+            validator.validate_all, req.query, citations_for_llm, topic_name
+        )
+    except Exception as e:
+        logger.exception("[ERROR] Stream query failed: %s", e)
+        return ORJSONResponse(status_code=500, content={"error": f"Query processing failed: {str(e)}"})
+
+    if validation_report['action'] == 'BLOCK':
+        return ORJSONResponse(
+            status_code=400,
+            content={
+                "error": "引用驗證失敗，系統無法提供可信回答",
+                "details": validation_report['errors'],
+                "suggestion": "建議諮詢專業律師或聯繫勞動主管機關",
+                "status": "BLOCKED"
+            },
+            background=BackgroundTask(
+                _save_session_messages, req.session_id, [("user", req.query), ("assistant", BLOCKED_MESSAGE)]
+            ),
+        )
+
+    final_citations = decorate_citations(citations_for_llm)
+    messages = _build_llm_messages(req, citations_for_llm, prepared.conversation_history)
+    answer_parts: List[str] = []
+
+    async def event_stream():
+        yield _sse("citations", {
+            "citations": final_citations,
+            "normalized_query": (prepared.rewritten_q if prepared.rewritten_q != req.query else None),
+            "validation": validation_report,
+        })
+
+        client = get_async_openai_client()
+        try:
+            stream = await client.chat.completions.create(
+                model="gpt-5-mini",
+                messages=messages,
+                temperature=0.7,
+                stream=True,
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    answer_parts.append(delta)
+                    yield _sse("delta", {"delta": delta})
+        except Exception as e:
+            yield _sse("error", {"error": f"LLM generation failed: {e}"})
+            return
+
+        # 🆕 Phase 2.5 警告與引用提醒附加在答案末尾
+        tail = prepared.ir_insufficient_warning
+        if validation_report['action'] == 'WARN':
+            tail += "\n\n⚠️ **引用提醒**：\n" + "\n".join(validation_report['warnings'])
+        if tail:
+            answer_parts.append(tail)
+            yield _sse("delta", {"delta": tail})
+
+        # 與 /query 相同：成功產生答案的查詢才計入 /metrics（延遲含完整串流）
+        _record_query_metrics(time.time() - prepared.start_time, len(citations_for_llm))
+        yield _sse("done", {
+            "used_hyde": prepared.used_hyde,
+            "used_intelligent_retrieval": prepared.used_intelligent_retrieval,
+            "ir_iterations": prepared.ir_iterations,
+            "ir_forced_articles": prepared.ir_forced_articles,
+            "query_plan_main_issue": prepared.query_plan_main_issue,
+            "query_plan_sub_issues": prepared.query_plan_sub_issues_count,
+            "multipath_results_count": prepared.multipath_results_count,
+        })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(_save_stream_messages, req.session_id, req.query, answer_parts),
+    )
 
 
 @app.post("/api/citation/report-error")
@@ -635,7 +953,7 @@ def report_citation_error(req: CitationErrorReport):
     return {"status": "recorded", "message": "感謝您的回報，我們會儘快處理"}
 
 
-@app.get("/api/citation/error-reports")
+@app.get("/api/citation/error-reports", response_class=ORJSONResponse)
 def get_citation_error_reports(limit: int = 50, status: Optional[str] = None):
     """查詢引用錯誤回報（管理用）"""
     reports = db.get_citation_error_reports(limit=limit, status=status)
@@ -647,7 +965,7 @@ def get_citation_error_reports(limit: int = 50, status: Optional[str] = None):
 
 # 🆕 Phase 3: Multi-Agent Query Endpoint
 @app.post("/query/multi-agent", response_model=MultiAgentResponse)
-def query_multi_agent(req: MultiAgentRequest):
+async def query_multi_agent(req: MultiAgentRequest):
     """
     多代理查詢端點（Phase 3）
     
@@ -657,8 +975,10 @@ def query_multi_agent(req: MultiAgentRequest):
     3. 審核員：質量控制
     4. 秘書：美化輸出
     """
-    coordinator = MultiAgentCoordinator()
-    return coordinator.process(req)
+    # 啟動時初始化失敗則於請求時重建（並回報真正的錯誤）
+    return await (
+        coordinator or MultiAgentCoordinator(query_planner=query_planner, query_enhancer=query_enhancer)
+    ).aprocess(req)
 
 
 # Static files for simple UI
@@ -671,7 +991,7 @@ def root_page():
     index_html = STATIC_DIR / "index.html"
     if index_html.exists():
         return FileResponse(str(index_html))
-    return JSONResponse({"message": "RAG API is running. Place UI in /static."})
+    return ORJSONResponse({"message": "RAG API is running. Place UI in /static."})
 
 
 # ===== Session Management (MVP Placeholder) =====
@@ -694,7 +1014,7 @@ def create_session(data: SessionCreate = None):
     return {"session_id": session_id, "created_at": session["created_at"]}
 
 
-@app.get("/session/{session_id}")
+@app.get("/session/{session_id}", response_class=ORJSONResponse)
 def get_session(session_id: str):
     """Get session history (persisted in SQLite)"""
     session = db.get_session(session_id)
@@ -719,20 +1039,21 @@ def submit_feedback(data: FeedbackSubmit):
     return {"status": "ok", "message": "感謝您的回饋"}
 
 
-@app.get("/metrics")
+@app.get("/metrics", response_class=ORJSONResponse)
 def get_metrics():
     """Get system metrics (persisted in SQLite)"""
-    avg_latency = METRICS["total_latency"] / METRICS["total_queries"] if METRICS["total_queries"] > 0 else 0
-    avg_citations = METRICS["total_citations"] / METRICS["total_queries"] if METRICS["total_queries"] > 0 else 0
+    with _METRICS_LOCK:
+        total_queries = METRICS["total_queries"]
+        total_latency = METRICS["total_latency"]
+        total_citations = METRICS["total_citations"]
+    avg_latency = total_latency / total_queries if total_queries > 0 else 0
+    avg_citations = total_citations / total_queries if total_queries > 0 else 0
     
-    # Get counts from database
-    with db.get_conn() as conn:
-        total_sessions = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
-        total_feedbacks = conn.execute("SELECT COUNT(*) FROM feedback").fetchone()[0]
-        total_messages = conn.execute("SELECT COUNT(*) FROM messages WHERE role='user'").fetchone()[0]
+    # Get counts from database (cached for METRICS_DB_TTL seconds)
+    total_sessions, total_feedbacks, total_messages = _db_counts(int(time.time() // METRICS_DB_TTL))
     
     return {
-        "total_queries": METRICS["total_queries"],  # Real-time counter
+        "total_queries": total_queries,  # Real-time counter
         "total_queries_db": total_messages,  # Persisted count
         "average_latency_seconds": round(avg_latency, 3),
         "average_citations": round(avg_citations, 2),
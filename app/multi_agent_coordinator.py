@@ -1,17 +1,29 @@
 """多代理協調器：統籌所有 Agent 協作"""
 from __future__ import annotations
 
-from typing import Dict, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 from pathlib import Path
 from datetime import datetime
+from functools import cached_property, lru_cache
+import asyncio
+import atexit
 import json
+import queue
+import threading
 from pydantic import BaseModel
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
 from .agents import ReceptionistAgent, LawyerAgent, SupervisorAgent, SecretaryAgent
-from .retrieval import hybrid_search
-from .law_guides import LawGuideEngine
+from .retrieval import hybrid_search_batch
+from .law_guides import get_engine
 from .articles import find_article
-import re
+from .rules import resolve_topic
+from .agents.lawyer import LawyerResponse
 
 
 class MultiAgentRequest(BaseModel):
@@ -19,6 +31,7 @@ class MultiAgentRequest(BaseModel):
     query: str
     top_k: int = 10
     max_retries: int = 2
+    use_query_expansion: bool = False  # 以查詢規劃子問題與 HyDE 增加檢索路徑（需額外 LLM 呼叫）
 
 
 class MultiAgentResponse(BaseModel):
@@ -31,6 +44,88 @@ class MultiAgentResponse(BaseModel):
 
 ROOT = Path(__file__).resolve().parents[1]
 
+# 核心條文預取（find_article 需掃描法規檔案，與檢索並行以隱藏 I/O）
+_ARTICLE_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="article-prefetch")
+ARTICLE_PREFETCH_WAIT = 0.5  # 秒；逾時則改為同步查詢
+# 審核意見含以下字樣時給一次額外重試
+_EXTRA_RETRY_KEYWORDS = ("缺少關鍵引用", "法律條文不存在")
+
+class _FailureLogWriter:
+    """背景執行緒批次寫入失敗記錄：請求端只需入列，檔案只開啟一次，佇列清空時才 flush。"""
+
+    _STOP = object()
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._drain, name="failure-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, entry: Dict) -> None:
+        self._queue.put(entry)
+
+    def close(self, timeout: float = 2.0) -> None:
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+
+    @staticmethod
+    def _encode(entry: Dict) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE)
+        return (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def _drain(self) -> None:
+        fp = None
+        while True:
+            entry = self._queue.get()
+            if entry is self._STOP:
+                break
+            try:
+                if fp is None:
+                    fp = self.path.open("ab")
+                fp.write(self._encode(entry))
+                if self._queue.empty():
+                    fp.flush()
+            except Exception as exc:
+                print(f"[Coordinator] Failed to log failure: {exc}")
+        if fp is not None:
+            fp.close()
+
+
+_FAILURE_LOG_WRITERS: Dict[Path, _FailureLogWriter] = {}
+_FAILURE_LOG_WRITERS_LOCK = threading.Lock()
+
+
+def _failure_log_writer(path: Path) -> _FailureLogWriter:
+    """每個記錄檔共用一個寫入執行緒"""
+    with _FAILURE_LOG_WRITERS_LOCK:
+        writer = _FAILURE_LOG_WRITERS.get(path)
+        if writer is None:
+            writer = _FAILURE_LOG_WRITERS[path] = _FailureLogWriter(path)
+        return writer
+
+
+# 刪除所有空白字元（與 re 的 \s 相同集合；Unicode 空白皆不超過 U+3000）
+_WS_TABLE = {c: None for c in range(0x3001) if chr(c).isspace()}
+
+
+def _citation_dict(meta: Dict) -> Dict:
+    """檢索結果 metadata 轉為引用 dict（欄位可能缺漏，故用綁定的 get 而非 itemgetter）"""
+    get = meta.get
+    law_id = get("law_id")
+    return {
+        "id": get("id"),
+        "law_name": law_id,
+        "law_id": law_id,
+        "title": get("title", ""),
+        "article_no": get("article_no", "").strip(),
+        "heading": get("heading", ""),
+        "text": get("text", ""),
+        "source_file": get("source_file", ""),
+        "chapter": get("chapter", ""),
+    }
+
 
 class MultiAgentCoordinator:
     """
@@ -42,28 +137,80 @@ class MultiAgentCoordinator:
     3. 記錄處理過程
     """
     
-    def __init__(self):
-        self.receptionist = ReceptionistAgent()
-        self.lawyer = LawyerAgent()
-        self.supervisor = SupervisorAgent()
-        self.secretary = SecretaryAgent()
+    def __init__(self, query_planner=None, query_enhancer=None):
+        # Agent 與法律指引於首次使用時才建立（見下方 cached_property）
+        # 選用：查詢規劃器與 HyDE 增強器（提供額外檢索路徑）
+        self.query_planner = query_planner
+        self.query_enhancer = query_enhancer
+        self.failure_log_path = ROOT / "logs" / "multi_agent_failures.log"
+        self.failure_log_path.parent.mkdir(exist_ok=True)
+
+    @cached_property
+    def receptionist(self) -> ReceptionistAgent:
+        return ReceptionistAgent()
+
+    @cached_property
+    def lawyer(self) -> LawyerAgent:
+        return LawyerAgent()
+
+    @cached_property
+    def supervisor(self) -> SupervisorAgent:
+        return SupervisorAgent()
+
+    @cached_property
+    def secretary(self) -> SecretaryAgent:
+        return SecretaryAgent()
+
+    @cached_property
+    def law_guide_engine(self):
         try:
-            self.law_guide_engine = LawGuideEngine()
+            return get_engine()
         except Exception as exc:
             print(f"[Coordinator] Warning: failed to load law guides: {exc}")
-            self.law_guide_engine = None
-        self.failure_log_path = ROOT / "logs" / "multi_agent_failures.log"
-        self.failure_log_path.parent.mkdir(exist_ok=True)
+            return None
+
+    @cached_property
+    def _core_articles(self) -> Dict[str, tuple]:
+        return self._build_core_articles(self.law_guide_engine)
     
     def process(self, req: MultiAgentRequest) -> MultiAgentResponse:
+        """
+        處理用戶查詢（同步版本，律師以同步客戶端呼叫 LLM）
+        """
+        async def generate_answer(**kwargs) -> LawyerResponse:
+            return await asyncio.to_thread(self.lawyer.generate_answer, **kwargs)
+
+        return asyncio.run(self._process(req, generate_answer))
+
+    async def aprocess(self, req: MultiAgentRequest) -> MultiAgentResponse:
+        """
+        處理用戶查詢（非同步版本，律師以 AsyncOpenAI 呼叫 LLM）
+        """
+        return await self._process(req, self.lawyer.agenerate_answer)
+
+    async def _process(
+        self,
+        req: MultiAgentRequest,
+        generate_answer: Callable[..., Awaitable[LawyerResponse]],
+    ) -> MultiAgentResponse:
         """
         處理用戶查詢（多代理協作流程）
+
+        本地運算步驟（接待員、檢索、審核、秘書）在執行緒中進行，不阻塞事件迴圈；
+        接待員分析、主題解析與（啟用 use_query_expansion 時的）查詢規劃、HyDE 彼此獨立，同時進行。
         """
         process_log = []
         
-        # Step 1: 接待員分析
+        # Step 1: 接待員分析（同時解析檢索主題；啟用查詢擴展時另規劃查詢、生成 HyDE）
         print(f"[Coordinator] Step 1: Receptionist analyzing query...")
-        analysis = self.receptionist.analyze(req.query)
+        steps = [
+            asyncio.to_thread(self.receptionist.analyze, req.query),
+            asyncio.to_thread(resolve_topic, req.query),
+        ]
+        if req.use_query_expansion:
+            steps += [self._plan(req.query), self._hyde(req.query)]
+        analysis, topic, *expansion = await asyncio.gather(*steps)
+        query_plan, hyde_text = expansion or (None, None)
         process_log.append({
             "step": "receptionist",
             "result": {
@@ -75,45 +222,16 @@ class MultiAgentCoordinator:
         })
         print(f"[Coordinator] Analysis: {analysis.reasoning}")
         
-        # Step 2: 執行檢索（使用接待員的策略）
+        # Step 2: 執行檢索（使用接待員的策略；同時預取主題核心條文）
         print(f"[Coordinator] Step 2: Retrieving citations...")
-        strategy = analysis.strategy
-        
-        from .rules import resolve_topic
-        topic = resolve_topic(req.query)
-        
-        citations = hybrid_search(
-            query=req.query,
-            top_k=min(strategy.get("top_k", req.top_k), req.top_k),
-            use_rerank=strategy.get("use_rerank", False),
-            preferred_laws=topic.preferred_laws if topic else None,
-            blocked_laws=topic.blocked_laws if topic else None,
-            prior_articles=topic.prior_articles if topic else None
-        )
-        
-        # 轉換為 dict 格式
-        citations_list = [
-            {
-                "id": c[1].get("id"),
-                "law_name": c[1].get("law_id"),
-                "law_id": c[1].get("law_id"),
-                "title": c[1].get("title", ""),
-                "article_no": c[1].get("article_no", "").strip(),
-                "heading": c[1].get("heading", ""),
-                "text": c[1].get("text", ""),
-                "source_file": c[1].get("source_file", ""),
-                "chapter": c[1].get("chapter", "")
-            }
-            for c in citations
-        ]
-        citations_list = self._inject_required_citations(
-            analysis.topics,
-            citations_list
-        )
+        article_prefetch = self._prefetch_core_articles(analysis.topics)
+        extra_queries = self._extra_queries(query_plan, hyde_text)
+        citations_list = await self._retrieve(req, analysis, topic, extra_queries, article_prefetch)
         
         process_log.append({
             "step": "retrieval",
             "result": {
+                "paths": 1 + len(extra_queries),
                 "count": len(citations_list),
                 "top_3": [c["article_no"] for c in citations_list[:3] if c.get("article_no")]
             }
@@ -121,17 +239,17 @@ class MultiAgentCoordinator:
         print(f"[Coordinator] Retrieved {len(citations_list)} citations")
         
         # Step 3: 律師生成答案（帶重試）
-        retry_count = 0
         retry_feedback = None
         lawyer_response = None
         review = None
         extra_retry_granted = False
-        max_retries = req.max_retries
-        
-        while retry_count <= req.max_retries:
-            print(f"[Coordinator] Step 3: Lawyer generating answer (attempt {retry_count + 1})...")
+        max_attempts = req.max_retries + 1
+
+        # 最多 max_retries + 1 次，外加一次可能的額外重試；每輪皆以 break 或 return 結束
+        for attempt in range(1, req.max_retries + 3):
+            print(f"[Coordinator] Step 3: Lawyer generating answer (attempt {attempt})...")
             
-            lawyer_response = self.lawyer.generate_answer(
+            lawyer_response = await generate_answer(
                 query=req.query,
                 analysis=analysis,
                 citations=citations_list,
@@ -139,7 +257,7 @@ class MultiAgentCoordinator:
             )
             
             process_log.append({
-                "step": f"lawyer_attempt_{retry_count + 1}",
+                "step": f"lawyer_attempt_{attempt}",
                 "result": {
                     "confidence": lawyer_response.confidence,
                     "used_citations": len(lawyer_response.used_citations),
@@ -150,7 +268,8 @@ class MultiAgentCoordinator:
             
             # Step 4: 審核員檢查
             print(f"[Coordinator] Step 4: Supervisor reviewing...")
-            review = self.supervisor.review(
+            review = await asyncio.to_thread(
+                self.supervisor.review,
                 lawyer_response=lawyer_response,
                 citations=citations_list,
                 analysis=analysis,
@@ -158,7 +277,7 @@ class MultiAgentCoordinator:
             )
             
             process_log.append({
-                "step": f"supervisor_attempt_{retry_count + 1}",
+                "step": f"supervisor_attempt_{attempt}",
                 "result": {
                     "decision": review.decision,
                     "quality_score": review.quality_score,
@@ -172,45 +291,44 @@ class MultiAgentCoordinator:
             if review.decision == "PASS" or review.decision == "WARN":
                 # 通過或警告：繼續
                 break
-            
-            elif review.decision == "REJECT":
-                # 拒絕：重試
-                retry_count += 1
-                if (
-                    retry_count > max_retries
-                    and not extra_retry_granted
-                    and self._should_force_extra_retry(review)
-                ):
-                    max_retries += 1
-                    extra_retry_granted = True
-                    print("[Coordinator] Extra retry granted due to critical missing citations")
-
-                if retry_count <= max_retries:
-                    retry_feedback = review.feedback
-                    print(f"[Coordinator] Retrying generation... ({retry_count}/{max_retries})")
-                else:
-                    # 超過重試次數，返回錯誤
-                    print(f"[Coordinator] Max retries reached, returning error response")
-                    self._log_failure(req.query, review, process_log)
-                    return MultiAgentResponse(
-                        answer="抱歉，系統經過多次嘗試後仍無法生成可靠的回答。建議您諮詢專業律師或聯繫勞動主管機關。",
-                        suggestions=[
-                            "諮詢專業勞動法律師",
-                            "聯繫勞動部或地方勞工局",
-                            "保留相關證據以備不時之需"
-                        ],
-                        metadata={
-                            "error": "quality_check_failed",
-                            "attempts": retry_count,
-                            "query_type": analysis.query_type,
-                            "complexity": analysis.complexity
-                        },
-                        process_log=process_log
-                    )
+
+            # 拒絕：重試
+            if (
+                attempt == max_attempts
+                and not extra_retry_granted
+                and self._should_force_extra_retry(review)
+            ):
+                max_attempts += 1
+                extra_retry_granted = True
+                print("[Coordinator] Extra retry granted due to critical missing citations")
+
+            if attempt >= max_attempts:
+                # 超過重試次數，返回錯誤
+                print(f"[Coordinator] Max retries reached, returning error response")
+                self._log_failure(req.query, review, process_log)
+                return MultiAgentResponse(
+                    answer="抱歉，系統經過多次嘗試後仍無法生成可靠的回答。建議您諮詢專業律師或聯繫勞動主管機關。",
+                    suggestions=[
+                        "諮詢專業勞動法律師",
+                        "聯繫勞動部或地方勞工局",
+                        "保留相關證據以備不時之需"
+                    ],
+                    metadata={
+                        "error": "quality_check_failed",
+                        "attempts": attempt,
+                        "query_type": analysis.query_type,
+                        "complexity": analysis.complexity
+                    },
+                    process_log=process_log
+                )
+
+            retry_feedback = review.feedback
+            print(f"[Coordinator] Retrying generation... ({attempt}/{max_attempts - 1})")
         
         # Step 5: 秘書美化
         print(f"[Coordinator] Step 5: Secretary formatting response...")
-        final_response = self.secretary.format_response(
+        final_response = await asyncio.to_thread(
+            self.secretary.format_response,
             lawyer_response=lawyer_response,
             review=review,
             analysis=analysis,
@@ -232,17 +350,139 @@ class MultiAgentCoordinator:
             process_log=process_log
         )
 
+    async def _plan(self, query: str):
+        """查詢規劃（無規劃器時回傳 None）"""
+        if not self.query_planner:
+            return None
+        try:
+            return await asyncio.to_thread(self.query_planner.plan_query, query)
+        except Exception as exc:
+            print(f"[Coordinator] Query planning failed: {exc}")
+            return None
+
+    async def _hyde(self, query: str) -> Optional[str]:
+        """抽象問題的 HyDE 假設性條文（不適用或失敗時回傳 None）"""
+        enhancer = self.query_enhancer
+        if not enhancer or not enhancer.should_use_hyde(query):
+            return None
+        try:
+            text = await asyncio.to_thread(enhancer.generate_hypothetical_document, query)
+        except Exception as exc:
+            print(f"[Coordinator] HyDE failed: {exc}")
+            return None
+        return text if text and text != query else None
+
     @staticmethod
+    def _extra_queries(query_plan, hyde_text: Optional[str]) -> List[str]:
+        """HyDE 與重要子問題關鍵字構成的額外檢索查詢"""
+        queries = [hyde_text] if hyde_text else []
+        if query_plan:
+            for sub_issue in query_plan.sub_issues:
+                if sub_issue.importance in ("high", "medium") and sub_issue.keywords:
+                    queries.append(" ".join(sub_issue.keywords))
+        return list(dict.fromkeys(queries))
+
+    async def _retrieve(
+        self,
+        req: MultiAgentRequest,
+        analysis,
+        topic,
+        extra_queries: List[str] = (),
+        article_prefetch: Optional[Dict[Tuple[str, str], Future]] = None,
+    ) -> List[Dict]:
+        """依接待員策略執行檢索（各路徑的查詢向量一次批次取得），並補齊主題核心條文"""
+        strategy = analysis.strategy
+        top_k = min(strategy.get("top_k", req.top_k), req.top_k)
+        paths = await asyncio.to_thread(
+            hybrid_search_batch,
+            [req.query, *extra_queries],
+            top_k=top_k,
+            use_rerank=strategy.get("use_rerank", False),
+            preferred_laws=topic.preferred_laws if topic else None,
+            blocked_laws=topic.blocked_laws if topic else None,
+            prior_articles=topic.prior_articles if topic else None
+        )
+        citations = self._merge_paths(paths, top_k)
+        
+        # 轉換為 dict 格式
+        citations_list = [_citation_dict(c[1]) for c in citations]
+        return await asyncio.to_thread(
+            self._inject_required_citations,
+            analysis.topics,
+            citations_list,
+            article_prefetch
+        )
+
+    @staticmethod
+    def _merge_paths(paths: List[List], top_k: int) -> List:
+        """合併多路徑檢索結果：依 (law_id, article_no) 去重保留最高分，排序後取 top_k"""
+        if len(paths) == 1:
+            return paths[0]
+        best: Dict[tuple, tuple] = {}
+        for results in paths:
+            for item in results:
+                meta = item[1]
+                key = (meta.get("law_id"), str(meta.get("article_no", "")).strip())
+                current = best.get(key)
+                if current is None or item[0] > current[0]:
+                    best[key] = item
+        return sorted(best.values(), key=lambda item: item[0], reverse=True)[:top_k]
+
+    @staticmethod
+    @lru_cache(maxsize=256)
     def _normalize_law_key(name: Optional[str]) -> str:
         if not name:
             return ""
-        cleaned = re.sub(r"\s+", "", name)
-        return cleaned.lower()
+        return name.translate(_WS_TABLE).lower()
+
+    @classmethod
+    def _build_core_articles(cls, engine) -> Dict[str, tuple]:
+        """topic_id -> ((正規化鍵, 法律名稱, 條號), ...)，預先正規化各主題核心條文"""
+        if not engine:
+            return {}
+        core: Dict[str, tuple] = {}
+        for topic_id, guide in engine.guides.items():
+            items = []
+            for entry in (guide or {}).get("core_articles", []):
+                law_name = entry.get("law")
+                if not law_name:
+                    continue
+                law_key = cls._normalize_law_key(law_name)
+                for art in entry.get("articles") or []:
+                    art_no = str(art).strip()
+                    if art_no:
+                        items.append(((law_key, art_no), law_name, art_no))
+            core[topic_id] = tuple(items)
+        return core
+
+    def _prefetch_core_articles(self, topics: List[str]) -> Dict[Tuple[str, str], Future]:
+        """為各主題核心條文送出 find_article 查詢，回傳 (法律名稱, 條號) -> Future"""
+        futures: Dict[Tuple[str, str], Future] = {}
+        for topic_id in topics or ():
+            for _, law_name, art_no in self._core_articles.get(topic_id, ()):
+                if (law_name, art_no) not in futures:
+                    futures[(law_name, art_no)] = _ARTICLE_POOL.submit(find_article, law_name, art_no)
+        return futures
+
+    @staticmethod
+    def _lookup_article(
+        law_name: str,
+        art_no: str,
+        prefetched: Optional[Dict[Tuple[str, str], Future]]
+    ) -> Optional[Dict]:
+        future = prefetched.get((law_name, art_no)) if prefetched else None
+        if future is not None:
+            try:
+                return future.result(timeout=ARTICLE_PREFETCH_WAIT)
+            except Exception:
+                pass  # 逾時或失敗：改為同步查詢
+        return find_article(law_name, art_no)
 
     def _inject_required_citations(
         self,
         topics: List[str],
-        citations: List[Dict]
+        citations: List[Dict],
+        prefetched: Optional[Dict[Tuple[str, str], Future]] = None
     ) -> List[Dict]:
         """
         確保每個主題的核心條文至少出現在引用列表中。
@@ -259,35 +499,26 @@ class MultiAgentCoordinator:
             for c in citations
         }
 
+        core_articles = self._core_articles
         for topic_id in topics:
-            guide = self.law_guide_engine.guides.get(topic_id) if self.law_guide_engine else None
-            if not guide:
-                continue
-            for entry in guide.get("core_articles", []):
-                law_name = entry.get("law")
-                if not law_name:
+            for key, law_name, art_no in core_articles.get(topic_id, ()):
+                if key in seen:
                     continue
-                articles = entry.get("articles") or []
-                for art in articles:
-                    art_no = str(art).strip()
-                    key = (self._normalize_law_key(law_name), art_no)
-                    if key in seen or not art_no:
-                        continue
-                    article_data = find_article(law_name, art_no)
-                    if not article_data:
-                        continue
-                    citations.append({
-                        "id": f"{law_name}-{art_no}",
-                        "law_name": law_name,
-                        "law_id": law_name,
-                        "title": law_name,
-                        "article_no": art_no,
-                        "heading": article_data.get("heading", ""),
-                        "text": article_data.get("text", ""),
-                        "source_file": article_data.get("law_file", ""),
-                        "chapter": ""
-                    })
-                    seen.add(key)
+                article_data = self._lookup_article(law_name, art_no, prefetched)
+                if not article_data:
+                    continue
+                citations.append({
+                    "id": f"{law_name}-{art_no}",
+                    "law_name": law_name,
+                    "law_id": law_name,
+                    "title": law_name,
+                    "article_no": art_no,
+                    "heading": article_data.get("heading", ""),
+                    "text": article_data.get("text", ""),
+                    "source_file": article_data.get("law_file", ""),
+                    "chapter": ""
+                })
+                seen.add(key)
 
         return citations
 
@@ -296,9 +527,10 @@ class MultiAgentCoordinator:
         """
         針對缺少關鍵引用或引用不存在等情況，自動給一次額外重試。
         """
-        keywords = ["缺少關鍵引用", "法律條文不存在"]
-        corpus = (review.feedback or "") + " ".join(review.errors or [])
-        return any(kw in corpus for kw in keywords)
+        for text in (review.feedback, *(review.errors or ())):
+            if text and any(kw in text for kw in _EXTRA_RETRY_KEYWORDS):
+                return True
+        return False
 
     def _log_failure(self, query: str, review, process_log: List[Dict]) -> None:
         """
@@ -314,8 +546,7 @@ class MultiAgentCoordinator:
                 "warnings": review.warnings if review else [],
                 "process_log": process_log,
             }
-            with self.failure_log_path.open("a", encoding="utf-8") as fp:
-                fp.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            _failure_log_writer(self.failure_log_path).put(entry)
         except Exception as exc:
             print(f"[Coordinator] Failed to log failure: {exc}")
 
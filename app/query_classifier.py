@@ -3,6 +3,10 @@
 借鑒 UniHR 的分類邏輯，但保持簡潔
 """
 
+from functools import lru_cache
+
+from .keyword_matcher import KeywordMatcher
+
 # 問題類型定義
 INFO = "INFO"               # 資訊查詢類
 PROFESSIONAL = "PROFESSIONAL"  # 專業諮詢類
@@ -24,6 +28,11 @@ PROFESSIONAL_KEYWORDS = [
 ]
 
 
+# 一次掃描同時取得專業諮詢與資訊查詢關鍵詞
+_MATCHER = KeywordMatcher({PROFESSIONAL: PROFESSIONAL_KEYWORDS, INFO: INFO_KEYWORDS})
+
+
+@lru_cache(maxsize=2048)
 def classify_query(query: str) -> str:
     """
     對用戶問題進行簡單分類
@@ -36,13 +45,12 @@ def classify_query(query: str) -> str:
     """
     query_lower = query.lower().strip()
     
-    # 計算專業諮詢評分
-    professional_score = 0
+    hits = _MATCHER.scan(query_lower)
     
-    # 包含專業諮詢關鍵詞
-    for keyword in PROFESSIONAL_KEYWORDS:
-        if keyword in query_lower:
-            professional_score += 1
+    # 計算專業諮詢評分：包含專業諮詢關鍵詞
+    professional_score = len(hits.get(PROFESSIONAL, ()))
+    if professional_score >= 2:
+        return PROFESSIONAL
     
     # 問題較長且複雜（> 30 字且包含逗號）
     if len(query_lower) > 30 and ("，" in query_lower or "、" in query_lower):
@@ -57,9 +65,8 @@ def classify_query(query: str) -> str:
         return PROFESSIONAL
     
     # 明確包含資訊查詢關鍵詞
-    for keyword in INFO_KEYWORDS:
-        if keyword in query_lower:
-            return INFO
+    if INFO in hits:
+        return INFO
     
     # 預設為資訊查詢
     return INFO
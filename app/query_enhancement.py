@@ -9,11 +9,16 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional
 
+import asyncio
 import json
+import functools
 import time
 
+from .keyword_matcher import KeywordMatcher
+from .llm_cache import cache_key, get_llm_cache
+
 try:
     from openai import OpenAI
     OPENAI_AVAILABLE = True
@@ -21,12 +26,32 @@ except ImportError:  # pragma: no cover
     OpenAI = None
     OPENAI_AVAILABLE = False
 
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional pooling
+    httpx = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
 ROOT = Path(__file__).resolve().parents[1]
+
+# should_use_hyde / should_decompose 的關鍵詞（單趟掃描）
+_MATCHER = KeywordMatcher({
+    "abstract": ["為什麼", "原因", "概念", "如何理解", "意義", "定義"],
+    "legal": ["勞基法", "條", "規定", "權利", "義務", "契約"],
+    "connector": ["以及", "或", "還有", "同時", "並", "而且"],
+})
 API_KEY_PATH = ROOT / "api key.txt"
 
 
+@functools.lru_cache(maxsize=1)
 def _read_api_key() -> Optional[str]:
-    """讀取 OpenAI API 金鑰，並容忍常見的 key 檔格式。"""
+    """讀取 OpenAI API 金鑰，並容忍常見的 key 檔格式（整個行程只讀一次）。"""
 
     if not API_KEY_PATH.exists():
         return None
@@ -56,6 +81,17 @@ def _read_api_key() -> Optional[str]:
     return lines[0] if lines else None
 
 
+def _pooled_http_client():
+    """Keep-alive pooled HTTP client (HTTP/2 when h2 is installed) shared by the enhancer's calls."""
+    if httpx is None:
+        return None
+    limits = httpx.Limits(max_keepalive_connections=32)
+    try:
+        return httpx.Client(http2=True, limits=limits)
+    except ImportError:  # h2 未安裝：改用 HTTP/1.1 連線池
+        return httpx.Client(limits=limits)
+
+
 class QueryEnhancer:
     """提供 HyDE、查詢拆解與查詢擴充等能力。"""
 
@@ -67,12 +103,18 @@ class QueryEnhancer:
         if not self.api_key:
             raise RuntimeError("OpenAI API key not found")
 
-        self.client = OpenAI(api_key=self.api_key)
+        self.client = OpenAI(api_key=self.api_key, http_client=_pooled_http_client())
         self.model = model
         print("[QueryEnhancer] Initialized with OpenAI API")
 
     def _chat(self, messages: List[dict], max_tokens: int) -> Optional[str]:
-        """Call the LLM, switching to Responses API for gpt-5 models."""
+        """Call the LLM, switching to Responses API for gpt-5 models (outputs cached by content)."""
+        llm_cache = get_llm_cache()
+        key = cache_key(self.model, messages, max_tokens=max_tokens)
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
+
         adjusted_tokens = max_tokens
         
         if self.model.startswith('gpt-5'):
@@ -105,7 +147,9 @@ class QueryEnhancer:
 
         if not text:
             return None
-        return text.strip()
+        text = text.strip()
+        llm_cache.put(key, text)
+        return text
 
     @staticmethod
     def _response_to_text(response) -> Optional[str]:
@@ -113,20 +157,18 @@ class QueryEnhancer:
         text = getattr(response, 'output_text', None)
         if text:
             return text.strip()
-        chunks = []
-        for item in getattr(response, 'output', []) or []:
-            content_list = getattr(item, 'content', None)
-            if not content_list:
-                continue
-            for content in content_list:
+        return '\n\n'.join(QueryEnhancer._iter_text(response)).strip() or None
+
+    @staticmethod
+    def _iter_text(response) -> Iterator[str]:
+        """Yield the non-empty text pieces of ``response.output`` content items."""
+        for item in getattr(response, 'output', None) or ():
+            for content in getattr(item, 'content', None) or ():
                 piece = getattr(content, 'text', None)
                 if piece is None and isinstance(content, dict):
                     piece = content.get('text')
                 if piece:
-                    chunks.append(piece)
-        if not chunks:
-            return None
-        return '\n\n'.join(chunks).strip()
+                    yield piece
 
     @staticmethod
     def _extract_json_list(text: Optional[str]) -> Optional[List[str]]:
@@ -140,15 +182,15 @@ class QueryEnhancer:
 
         snippet = text[start : end + 1]
         try:
-            data = json.loads(snippet)
-        except json.JSONDecodeError:
+            data = _json_loads(snippet)
+        except ValueError:  # json / orjson JSONDecodeError
             return None
 
         cleaned = [item.strip() for item in data if isinstance(item, str) and item.strip()]
         return cleaned or None
 
     def generate_hypothetical_document(self, query: str, doc_type: str = "法規說明") -> str:
-        """使用 HyDE 生成假設性條文。"""
+        """使用 HyDE 生成假設性條文（重複問題由 _chat 的 LLM 輸出快取直接回傳）。"""
 
         system_prompt = "你是台灣勞資法律研究員，負責撰寫條文摘要。"
         user_prompt = f"""使用者問題：{query}
@@ -231,14 +273,23 @@ class QueryEnhancer:
 
         return [query] + parsed[:3]
 
+    async def aenhance_all(self, query: str) -> Dict[str, object]:
+        """並行執行 HyDE、查詢拆解與查詢擴充（共用同一連線池，網路往返彼此重疊）。"""
+        hyde, subqueries, expansions = await asyncio.gather(
+            asyncio.to_thread(self.generate_hypothetical_document, query),
+            asyncio.to_thread(self.decompose_query, query),
+            asyncio.to_thread(self.expand_query, query),
+        )
+        return {"hyde": hyde, "subqueries": subqueries, "expansions": expansions}
+
     def should_use_hyde(self, query: str) -> bool:
         """判斷是否適合啟用 HyDE。"""
 
-        abstract_markers = ["為什麼", "原因", "概念", "如何理解", "意義", "定義"]
-        is_abstract = any(marker in query for marker in abstract_markers)
+        hits = _MATCHER.scan(query)
+        is_abstract = "abstract" in hits
 
         long_query = len(query) > 40
-        has_legal_keywords = any(kw in query for kw in ["勞基法", "條", "規定", "權利", "義務", "契約"])
+        has_legal_keywords = "legal" in hits
 
         return is_abstract or (long_query and not has_legal_keywords)
 
@@ -249,8 +300,7 @@ class QueryEnhancer:
         if question_marks > 1:
             return True
 
-        connectors = ["以及", "或", "還有", "同時", "並", "而且"]
-        connector_hits = sum(1 for conn in connectors if conn in query)
+        connector_hits = len(_MATCHER.scan(query).get("connector", ()))
 
         return len(query) > 40 and connector_hits >= 2
 
@@ -267,7 +317,11 @@ def get_query_enhancer() -> QueryEnhancer:
     return _ENHANCER_INSTANCE
 
 
+# 金鑰檔在行程啟動後不會出現/消失，匯入時判斷一次即可
+_AVAILABLE = OPENAI_AVAILABLE and API_KEY_PATH.exists()
+
+
 def is_available() -> bool:
     """確認模組是否具備初始化條件。"""
 
-    return OPENAI_AVAILABLE and API_KEY_PATH.exists()
+    return _AVAILABLE
@@ -22,16 +22,27 @@ if sys.platform == 'win32' and sys.stdout.encoding != 'utf-8':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
-import json
-from typing import List, Dict, Optional
-from pydantic import BaseModel
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from operator import itemgetter
+from typing import List, Dict, Optional, Set, Tuple
+from pydantic import BaseModel, PrivateAttr
+
+from .keyword_matcher import KeywordMatcher
+from .llm_cache import cache_key, get_llm_cache
 
 try:
-    from openai import OpenAI
+    from openai import AsyncOpenAI, OpenAI
     OPENAI_AVAILABLE = True
 except ImportError:
     OPENAI_AVAILABLE = False
     OpenAI = None
+    AsyncOpenAI = None
 
 
 # ============================================================
@@ -54,6 +65,8 @@ class QueryPlan(BaseModel):
     suggested_keywords: List[str]  # 建議的檢索關鍵字
     estimated_difficulty: str  # "simple" | "medium" | "complex"
     reasoning: str  # 推理過程
+    # 標準議題強制補入的條文 (法律名稱, 條號)，由 _harmonize_query_plan 設定
+    _forced_articles: List[Tuple[str, str]] = PrivateAttr(default_factory=list)
 
 # ============================================================
 # Canonical Issue Harmonization
@@ -93,6 +106,23 @@ CANONICAL_ISSUES = [
     },
 ]
 
+# 各標準議題的關鍵詞集合；文字只掃描一次，再以子集合判斷是否命中
+_CANONICAL_KEYWORD_SETS = [frozenset(config["keywords"]) for config in CANONICAL_ISSUES]
+_CANONICAL_MATCHER = KeywordMatcher({"canonical": {kw for config in CANONICAL_ISSUES for kw in config["keywords"]}})
+
+
+def _match_canonical_issue(user_text: str, plan_text_parts) -> Optional[Dict]:
+    """使用者原文全部命中者優先（取第一個），其次為計畫文字全部命中者。"""
+    user_hits = _CANONICAL_MATCHER.scan(user_text).get("canonical", set())
+    for config, keywords in zip(CANONICAL_ISSUES, _CANONICAL_KEYWORD_SETS):
+        if keywords <= user_hits:
+            return config
+    plan_hits = _CANONICAL_MATCHER.scan(" ".join(plan_text_parts).lower()).get("canonical", set())
+    for config, keywords in zip(CANONICAL_ISSUES, _CANONICAL_KEYWORD_SETS):
+        if keywords <= plan_hits:
+            return config
+    return None
+
 
 
 def _ensure_article_suggestion(query_plan: QueryPlan, law_name: str, article_no: str) -> None:
@@ -114,24 +144,11 @@ def _ensure_article_suggestion(query_plan: QueryPlan, law_name: str, article_no:
 def _harmonize_query_plan(query_plan: QueryPlan, original_query: str) -> QueryPlan:
     """統一 main_issue 命名並補齊必要法條/子議題。"""
     user_text = (original_query or "").lower()
-    plan_text = " ".join([
+    best_choice = _match_canonical_issue(user_text, [
         query_plan.main_issue or "",
         " ".join(si.issue for si in query_plan.sub_issues),
         original_query or "",
-    ]).lower()
-
-    best_choice = None
-    best_score = 0
-    for config in CANONICAL_ISSUES:
-        if all(keyword in user_text for keyword in config["keywords"]):
-            score = 2
-        elif all(keyword in plan_text for keyword in config["keywords"]):
-            score = 1
-        else:
-            continue
-        if score > best_score:
-            best_score = score
-            best_choice = config
+    ])
 
     if best_choice:
         query_plan.main_issue = best_choice["label"]
@@ -144,9 +161,9 @@ def _harmonize_query_plan(query_plan: QueryPlan, original_query: str) -> QueryPl
             _ensure_article_suggestion(query_plan, law_name, article_no)
         if best_choice.get("force_complex"):
             query_plan.estimated_difficulty = "complex"
-        setattr(query_plan, "_forced_articles", best_choice.get("forced_articles", []))
+        query_plan._forced_articles = best_choice.get("forced_articles", [])
     else:
-        setattr(query_plan, "_forced_articles", [])
+        query_plan._forced_articles = []
     return query_plan
 
 
@@ -155,6 +172,79 @@ def _harmonize_query_plan(query_plan: QueryPlan, original_query: str) -> QueryPl
 # Query Planner Class
 # ============================================================
 
+PLAN_CACHE_SIZE = 256
+PLAN_CACHE_TTL = 3600.0  # 秒
+
+PLANNER_SYSTEM_PROMPT = "你是台灣勞動法律專家和檢索系統規劃師。你的任務是精確識別用戶問題的法律本質，並規劃高效的檢索策略。"
+
+# 規劃指示為固定前綴（須放在用戶問題之前，OpenAI prompt caching 才能命中）
+PLANNER_INSTRUCTIONS = """你是台灣勞動法律專家和檢索系統規劃師。
+
+請**仔細分析**文末的用戶問題並規劃檢索策略。
+
+**任務**：
+1. **核心問題是什麼？**（用一句話精確概括，例如："資遣流程與費用計算"、"懷孕歧視與調職降薪"）
+2. **可以拆解為哪些子問題？**
+   - 每個子問題的重要性：high（核心問題）/ medium（相關問題）/ low（次要參考）
+   - 如果你知道具體法條，請明確列出（例如："勞動基準法第16條"）
+   - 為每個子問題提供 2-3 個檢索關鍵字
+3. **需要查詢哪些法律？**（法律全名）
+4. **建議使用哪些關鍵字進行全局檢索？**
+5. **估計問題難度**：simple（單一法條可回答）/ medium（需要 2-3 條法規）/ complex（跨法規、多面向）
+
+**重要提醒**：
+- 請仔細識別問題的核心類型（例如：「資遣」vs「加班」vs「職災」vs「性別歧視」）
+- 如果問題涉及多個面向，請全部列出（例如：資遣 = 預告期 + 資遣費 + 通報義務）
+- 如果問題提到「工資」，請判斷是「工資計算」還是「工資扣除」還是「資遣費」
+- 如果你知道具體的法條號碼，務必列出！這能大幅提高檢索準確性
+- **特別注意細則性法規**：如果問題涉及「請假」，務必考慮「勞工請假規則」；如果涉及「性別歧視」或「懷孕」，務必考慮「性別平等工作法」的關鍵條文（如第11條禁止性別歧視）
+
+**回答格式**：以 JSON 輸出，欄位須符合指定的 QueryPlan schema（sub_issues 每項含 issue、importance、suggested_articles、keywords）。
+"""
+
+
+def _strict_json_schema(schema: Dict) -> Dict:
+    """調整 pydantic 產生的 schema 以符合 OpenAI strict 模式：所有欄位必填、禁止額外欄位"""
+    if isinstance(schema, dict):
+        schema = {k: _strict_json_schema(v) for k, v in schema.items()}
+        if schema.get("type") == "object" and "properties" in schema:
+            schema["required"] = list(schema["properties"])
+            schema["additionalProperties"] = False
+    elif isinstance(schema, list):
+        schema = [_strict_json_schema(v) for v in schema]
+    return schema
+
+
+@lru_cache(maxsize=1)
+def _plan_response_format() -> Dict:
+    """Structured outputs：由 OpenAI 端強制輸出符合 QueryPlan 的 JSON"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "QueryPlan",
+            "schema": _strict_json_schema(QueryPlan.model_json_schema()),
+            "strict": True,
+        },
+    }
+
+
+def _normalize_plan_query(query: str) -> str:
+    """計畫快取鍵：NFKC、合併空白並轉小寫，讓僅格式不同的重複問題共用同一份計畫"""
+    return " ".join(unicodedata.normalize("NFKC", query).split()).lower()
+
+
+@lru_cache(maxsize=4)
+def _get_client(api_key: str):
+    """同一金鑰共用一個 OpenAI 客戶端（連線池跨實例保持暖機）"""
+    return OpenAI(api_key=api_key)
+
+
+@lru_cache(maxsize=4)
+def _get_async_client(api_key: str):
+    """同一金鑰共用一個 AsyncOpenAI 客戶端"""
+    return AsyncOpenAI(api_key=api_key)
+
+
 class QueryPlanner:
     """
     查詢規劃器（Phase 2.6 核心）
@@ -179,11 +269,19 @@ class QueryPlanner:
         if not api_key:
             raise RuntimeError("OpenAI API key not provided")
         
-        self.client = OpenAI(api_key=api_key)
+        self.api_key = api_key
+        self.client = _get_client(api_key)
         self.model = model
+        self._plan_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._plan_lock = threading.Lock()
         
         print(f"[QueryPlanner] Initialized with model: {self.model}")
     
+    @property
+    def async_client(self):
+        """共用的 AsyncOpenAI 客戶端（供 aplan_query 使用）"""
+        return _get_async_client(self.api_key)
+    
     def plan_query(self, query: str) -> QueryPlan:
         """
         分析問題並規劃檢索策略
@@ -194,90 +292,114 @@ class QueryPlanner:
         Returns:
             QueryPlan: 查詢計畫
         """
-        prompt = f"""你是台灣勞動法律專家和檢索系統規劃師。
-
-用戶問題：{query}
-
-請**仔細分析**這個問題並規劃檢索策略。
-
-**任務**：
-1. **核心問題是什麼？**（用一句話精確概括，例如："資遣流程與費用計算"、"懷孕歧視與調職降薪"）
-2. **可以拆解為哪些子問題？**
-   - 每個子問題的重要性：high（核心問題）/ medium（相關問題）/ low（次要參考）
-   - 如果你知道具體法條，請明確列出（例如："勞動基準法第16條"）
-   - 為每個子問題提供 2-3 個檢索關鍵字
-3. **需要查詢哪些法律？**（法律全名）
-4. **建議使用哪些關鍵字進行全局檢索？**
-5. **估計問題難度**：simple（單一法條可回答）/ medium（需要 2-3 條法規）/ complex（跨法規、多面向）
-
-**重要提醒**：
-- 請仔細識別問題的核心類型（例如：「資遣」vs「加班」vs「職災」vs「性別歧視」）
-- 如果問題涉及多個面向，請全部列出（例如：資遣 = 預告期 + 資遣費 + 通報義務）
-- 如果問題提到「工資」，請判斷是「工資計算」還是「工資扣除」還是「資遣費」
-- 如果你知道具體的法條號碼，務必列出！這能大幅提高檢索準確性
-- **特別注意細則性法規**：如果問題涉及「請假」，務必考慮「勞工請假規則」；如果涉及「性別歧視」或「懷孕」，務必考慮「性別平等工作法」的關鍵條文（如第11條禁止性別歧視）
-
-**回答格式（JSON）**：
-{{
-    "main_issue": "資遣流程與費用計算",
-    "sub_issues": [
-        {{
-            "issue": "資遣預告期規定",
-            "importance": "high",
-            "suggested_articles": ["勞動基準法第16條"],
-            "keywords": ["資遣", "預告期", "通知"]
-        }},
-        {{
-            "issue": "資遣費計算方式",
-            "importance": "high",
-            "suggested_articles": ["勞動基準法第17條"],
-            "keywords": ["資遣費", "計算", "年資"]
-        }},
-        {{
-            "issue": "主管機關通報義務",
-            "importance": "medium",
-            "suggested_articles": ["就業服務法第33條"],
-            "keywords": ["通報", "主管機關", "就業服務"]
-        }}
-    ],
-    "required_laws": ["勞動基準法", "就業服務法"],
-    "suggested_keywords": ["資遣", "預告期", "資遣費", "通報", "年資"],
-    "estimated_difficulty": "medium",
-    "reasoning": "問題涉及完整的資遣流程，需要涵蓋程序（預告、通報）與權利（資遣費）兩個面向，屬於中等難度的多面向問題"
-}}
-
-**開始分析**：
-"""
+        now = time.time()
+        plan_key = _normalize_plan_query(query)
+        plan = self._get_cached_plan(plan_key, now)
+        if plan is not None:
+            return plan
         
+        messages, key = self._build_request(query)
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "你是台灣勞動法律專家和檢索系統規劃師。你的任務是精確識別用戶問題的法律本質，並規劃高效的檢索策略。"
-                    },
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                response_format={"type": "json_object"}
-            )
-            
-            result = json.loads(response.choices[0].message.content)
-            query_plan = QueryPlan(**result)
-            query_plan = _harmonize_query_plan(query_plan, query)
-            
-            print(f"[QueryPlanner] 核心問題: {query_plan.main_issue}")
-            print(f"[QueryPlanner] 子問題數量: {len(query_plan.sub_issues)}")
-            print(f"[QueryPlanner] 涉及法律: {', '.join(query_plan.required_laws)}")
-            
-            return query_plan
-            
+            content = get_llm_cache().get(key)
+            cached = content is not None
+            if not cached:
+                response = self.client.chat.completions.create(**self._completion_kwargs(messages))
+                content = self._response_content(response)
+            return self._finish_plan(query, plan_key, now, content, None if cached else key)
         except Exception as e:
             print(f"[QueryPlanner] 規劃失敗: {e}")
             # 降級：返回簡化的查詢計畫
             return self._fallback_plan(query)
     
+    async def aplan_query(self, query: str) -> QueryPlan:
+        """
+        plan_query 的非同步版本（AsyncOpenAI），可與其他請求前處理並行等待
+        
+        Args:
+            query: 用戶問題
+            
+        Returns:
+            QueryPlan: 查詢計畫
+        """
+        now = time.time()
+        plan_key = _normalize_plan_query(query)
+        plan = self._get_cached_plan(plan_key, now)
+        if plan is not None:
+            return plan
+        
+        messages, key = self._build_request(query)
+        try:
+            content = get_llm_cache().get(key)
+            cached = content is not None
+            if not cached:
+                response = await self.async_client.chat.completions.create(**self._completion_kwargs(messages))
+                content = self._response_content(response)
+            return self._finish_plan(query, plan_key, now, content, None if cached else key)
+        except Exception as e:
+            print(f"[QueryPlanner] 規劃失敗: {e}")
+            return self._fallback_plan(query)
+    
+    def _get_cached_plan(self, plan_key: str, now: float) -> Optional[QueryPlan]:
+        with self._plan_lock:
+            cached = self._plan_cache.get(plan_key)
+            if cached and now - cached[0] < PLAN_CACHE_TTL:
+                self._plan_cache.move_to_end(plan_key)
+                print("[QueryPlanner] Cache hit")
+                # 呼叫端會再修改計畫內容，回傳深拷貝
+                return cached[1].model_copy(deep=True)
+        return None
+    
+    def _build_request(self, query: str) -> Tuple[List[Dict], str]:
+        """回傳 (messages, LLM 快取鍵)；送給 LLM 的是原始問題，正規化僅用於計畫快取鍵"""
+        # 固定指示在前、問題在後，讓 OpenAI 自動快取共同前綴
+        messages = [
+            {"role": "system", "content": PLANNER_SYSTEM_PROMPT},
+            {"role": "user", "content": f"{PLANNER_INSTRUCTIONS}\n用戶問題：{query}\n\n**開始分析**：\n"}
+        ]
+        return messages, cache_key(self.model, messages, temperature=0.3, response_format="json_schema")
+    
+    def _completion_kwargs(self, messages: List[Dict]) -> Dict:
+        return dict(
+            model=self.model,
+            messages=messages,
+            temperature=0.3,
+            response_format=_plan_response_format(),
+            extra_body={"prompt_cache_key": "query-planner"}
+        )
+    
+    @staticmethod
+    def _response_content(response) -> str:
+        details = getattr(getattr(response, "usage", None), "prompt_tokens_details", None)
+        print(f"[QueryPlanner] Cached prompt tokens: {getattr(details, 'cached_tokens', 0) or 0}")
+        return response.choices[0].message.content
+    
+    def _finish_plan(
+        self,
+        query: str,
+        plan_key: str,
+        now: float,
+        content: str,
+        store_key: Optional[str]
+    ) -> QueryPlan:
+        """解析 LLM 輸出、寫入快取（store_key 為 None 表示輸出本來就來自 LLM 快取）"""
+        # pydantic v2 直接在核心層解析並驗證 JSON，省去 json.loads 的中間 dict
+        query_plan = QueryPlan.model_validate_json(content)
+        if store_key is not None:
+            get_llm_cache().put(store_key, content)
+        query_plan = _harmonize_query_plan(query_plan, query)
+        
+        print(f"[QueryPlanner] 核心問題: {query_plan.main_issue}")
+        print(f"[QueryPlanner] 子問題數量: {len(query_plan.sub_issues)}")
+        print(f"[QueryPlanner] 涉及法律: {', '.join(query_plan.required_laws)}")
+        
+        with self._plan_lock:
+            self._plan_cache[plan_key] = (now, query_plan.model_copy(deep=True))
+            self._plan_cache.move_to_end(plan_key)
+            while len(self._plan_cache) > PLAN_CACHE_SIZE:
+                self._plan_cache.popitem(last=False)
+        
+        return query_plan
+    
     def _fallback_plan(self, query: str) -> QueryPlan:
         """
         降級方案：當 LLM 規劃失敗時，返回基礎查詢計畫
@@ -311,13 +433,44 @@ class QueryPlanner:
 # Multi-Path Retrieval Functions
 # ============================================================
 
+# 各檢索路徑彼此獨立，共用執行緒池並行執行
+_PATH_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="multipath")
+
+
+# Phase 2.6.1: LLM 未建議時自動補充的關鍵法條
+# keywords 命中核心問題（match_query 為 True 時也比對原始問題）即依序嘗試 targets，補入第一個找得到的條文
+AUTO_SUPPLEMENT_RULES = [
+    {
+        "label": "懷孕歧視關鍵條文",
+        "keywords": ("懷孕", "歧視"),
+        "match_query": False,
+        # 正確法律名稱是「性別平等工作法」，舊稱「性別工作平等法」為備援
+        "targets": (("性別平等工作法", "11"), ("性別工作平等法", "11")),
+        "score": 1.2,
+    },
+    {
+        "label": "請假規定關鍵條文",
+        "keywords": ("請假",),
+        "match_query": True,
+        "targets": (("勞工請假規則", "2"),),
+        "score": 1.2,
+    },
+]
+
+
+def _result_key(law_id: Optional[str], article_no: Optional[str]) -> Tuple[str, str]:
+    """去重用的 (法律, 條號) 鍵"""
+    return (law_id or "", (article_no or "").strip())
+
+
 def multi_path_retrieval(
     query: str,
     query_plan: QueryPlan,
     hybrid_search_func,
     rewritten_query: str,
     top_k: int = 10,
-    use_rerank: bool = False
+    use_rerank: bool = False,
+    hybrid_search_batch_func=None
 ) -> List[Dict]:
     """
     多路徑並行檢索
@@ -334,6 +487,7 @@ def multi_path_retrieval(
         rewritten_query: 重寫後的查詢
         top_k: 每個路徑返回的結果數量
         use_rerank: 是否使用重排序
+        hybrid_search_batch_func: 批次混合檢索函數（可選）；提供時路徑 2 的子問題查詢一次送出
         
     Returns:
         List[Dict]: 融合後的檢索結果
@@ -341,26 +495,81 @@ def multi_path_retrieval(
     print(f"[MultiPath] 開始多路徑檢索 (top_k={top_k})")
     
     all_results = []
-    seen_ids = set()
+    seen_ids: Set[Tuple[str, str]] = set()
     
-    # 路徑 1：基於全局關鍵字的混合檢索
-    try:
-        print(f"[MultiPath] 路徑1: 全局關鍵字檢索")
-        
-        # 使用 LLM 建議的關鍵字構建檢索查詢
-        global_query = " ".join(query_plan.suggested_keywords[:5])  # 最多 5 個關鍵字
-        
-        path1_results = hybrid_search_func(
-            global_query,
-            top_k=top_k,
+    def submit_search(search_query: str, k: int):
+        return _PATH_POOL.submit(
+            hybrid_search_func,
+            search_query,
+            top_k=k,
+            use_rerank=use_rerank,
+            preferred_laws=query_plan.required_laws,
+            blocked_laws=None,
+            prior_articles=None
+        )
+    
+    # 先送出所有混合檢索（路徑 1、2、4），再依原順序合併結果
+    # 使用 LLM 建議的關鍵字構建檢索查詢
+    global_query = " ".join(query_plan.suggested_keywords[:5])  # 最多 5 個關鍵字
+    path1_future = submit_search(global_query, top_k)
+    # 為每個高重要性子問題執行檢索
+    path2_issues = [
+        sub_issue for sub_issue in query_plan.sub_issues
+        if sub_issue.importance in ["high", "medium"]
+    ]
+    path2_queries = [" ".join(sub_issue.keywords) for sub_issue in path2_issues]
+    path2_k = max(3, top_k // 2)  # 每個子問題檢索較少結果
+    if hybrid_search_batch_func is not None and path2_issues:
+        # 子問題查詢一次批次取得向量（單次 embedding 呼叫）
+        path2_batch_future = _PATH_POOL.submit(
+            hybrid_search_batch_func,
+            path2_queries,
+            top_k=path2_k,
             use_rerank=use_rerank,
             preferred_laws=query_plan.required_laws,
             blocked_laws=None,
             prior_articles=None
         )
+        path2_futures = None
+    else:
+        path2_batch_future = None
+        path2_futures = [submit_search(q, path2_k) for q in path2_queries]
+    path4_future = submit_search(rewritten_query, top_k)
+    
+    # 路徑 3 的建議法條查詢（讀取法規檔）同樣送入執行緒池，與檢索重疊
+    from .articles import find_article
+    
+    suggested_pairs = []
+    for sub_issue in query_plan.sub_issues:
+        for suggested_article in sub_issue.suggested_articles:
+            # 解析法條字串（例如："勞動基準法第16條"）
+            law_name, article_no = _parse_article_string(suggested_article)
+            if law_name and article_no:
+                suggested_pairs.append((law_name, article_no))
+    # 依問題類型命中的自動補充規則，其候選條文一併預先查詢
+    main_issue_lower = query_plan.main_issue.lower()
+    query_lower = query.lower()
+    supplement_rules = [
+        rule for rule in AUTO_SUPPLEMENT_RULES
+        if any(kw in main_issue_lower for kw in rule["keywords"])
+        or (rule["match_query"] and any(kw in query_lower for kw in rule["keywords"]))
+    ]
+    article_futures = {
+        pair: _PATH_POOL.submit(find_article, *pair)
+        for pair in dict.fromkeys([
+            *suggested_pairs,
+            *(target for rule in supplement_rules for target in rule["targets"]),
+        ])
+    }
+    
+    # 路徑 1：基於全局關鍵字的混合檢索
+    try:
+        print(f"[MultiPath] 路徑1: 全局關鍵字檢索")
+        
+        path1_results = path1_future.result()
         
         for score, metadata in path1_results:
-            result_id = f"{metadata.get('law_id', '')}_{metadata.get('article_no', '')}"
+            result_id = _result_key(metadata.get("law_id"), metadata.get("article_no"))
             if result_id not in seen_ids:
                 seen_ids.add(result_id)
                 all_results.append({
@@ -384,35 +593,40 @@ def multi_path_retrieval(
     try:
         print(f"[MultiPath] 路徑2: 子問題語義檢索")
         
-        for sub_issue in query_plan.sub_issues:
-            # 為每個高重要性子問題執行檢索
-            if sub_issue.importance in ["high", "medium"]:
-                sub_query = " ".join(sub_issue.keywords)
-                
-                path2_results = hybrid_search_func(
-                    sub_query,
-                    top_k=max(3, top_k // 2),  # 每個子問題檢索較少結果
-                    use_rerank=use_rerank,
-                    preferred_laws=query_plan.required_laws,
-                    blocked_laws=None,
-                    prior_articles=None
-                )
-                
-                for score, metadata in path2_results:
-                    result_id = f"{metadata.get('law_id', '')}_{metadata.get('article_no', '')}"
-                    if result_id not in seen_ids:
-                        seen_ids.add(result_id)
-                        all_results.append({
-                            "law_name": metadata.get("law_id"),
-                            "law_id": metadata.get("law_id"),
-                            "article_no": metadata.get("article_no", "").strip(),
-                            "heading": metadata.get("heading", ""),
-                            "text": metadata.get("text", ""),
-                            "source_file": metadata.get("source_file", ""),
-                            "chapter": metadata.get("chapter", ""),
-                            "score": score,
-                            "source": f"path2_sub_issue_{sub_issue.importance}"
-                        })
+        if path2_batch_future is not None:
+            try:
+                path2_batches = path2_batch_future.result()
+            except Exception as e:
+                # 批次檢索失敗時改為逐一查詢
+                print(f"[MultiPath]   ✗ 路徑2 批次檢索失敗，改為逐一查詢: {e}")
+                path2_futures = [submit_search(q, path2_k) for q in path2_queries]
+        if path2_futures is not None:
+            # 單一子問題失敗不影響其他子問題
+            path2_batches = []
+            for sub_issue, future in zip(path2_issues, path2_futures):
+                try:
+                    path2_batches.append(future.result())
+                except Exception as e:
+                    print(f"[MultiPath]   ✗ 子問題檢索失敗（{sub_issue.issue}）: {e}")
+                    path2_batches.append([])
+        
+        for sub_issue, path2_results in zip(path2_issues, path2_batches):
+            
+            for score, metadata in path2_results:
+                result_id = _result_key(metadata.get("law_id"), metadata.get("article_no"))
+                if result_id not in seen_ids:
+                    seen_ids.add(result_id)
+                    all_results.append({
+                        "law_name": metadata.get("law_id"),
+                        "law_id": metadata.get("law_id"),
+                        "article_no": metadata.get("article_no", "").strip(),
+                        "heading": metadata.get("heading", ""),
+                        "text": metadata.get("text", ""),
+                        "source_file": metadata.get("source_file", ""),
+                        "chapter": metadata.get("chapter", ""),
+                        "score": score,
+                        "source": f"path2_sub_issue_{sub_issue.importance}"
+                    })
         
         print(f"[MultiPath]   ✓ 路徑2 完成，累計結果: {len(all_results)} 條")
         
@@ -423,114 +637,61 @@ def multi_path_retrieval(
     try:
         print(f"[MultiPath] 路徑3: 建議法條精確檢索")
         
-        from .articles import find_article
-        
         forced_count = 0
         
-        # Phase 2.6.1: 識別問題類型，自動補充關鍵法條
-        main_issue_lower = query_plan.main_issue.lower()
-        is_pregnancy_discrimination = "懷孕" in main_issue_lower or "歧視" in main_issue_lower
-        is_leave = "請假" in main_issue_lower or "請假" in query.lower()
-        
         # 收集 LLM 已建議的法條
-        llm_suggested_set = set()
-        
-        for sub_issue in query_plan.sub_issues:
-            for suggested_article in sub_issue.suggested_articles:
-                # 解析法條字串（例如："勞動基準法第16條"）
-                law_name, article_no = _parse_article_string(suggested_article)
-                
-                if law_name and article_no:
-                    llm_suggested_set.add((law_name, article_no))
-                    result_id = f"{law_name}_{article_no}"
-                    
-                    if result_id not in seen_ids:
-                        article_data = find_article(law_name, article_no)
-                        
-                        if article_data:
-                            seen_ids.add(result_id)
-                            all_results.append({
-                                "law_name": law_name,
-                                "law_id": law_name,
-                                "article_no": article_no,
-                                "heading": article_data.get("heading", f"第 {article_no} 條"),
-                                "text": article_data.get("text", ""),
-                                "source_file": article_data.get("law_file", ""),
-                                "chapter": "",
-                                "score": 1.0,  # 高分數（LLM 直接建議）
-                                "source": "path3_llm_suggested"
-                            })
-                            forced_count += 1
-                            print(f"[MultiPath]   ✓ 強制檢索: {law_name} 第 {article_no} 條")
+        llm_suggested_set = set(suggested_pairs)
         
-        # Phase 2.6.1: 自動補充關鍵法條（如果 LLM 沒有建議）
-        # 1. 懷孕歧視問題：自動補充性平法第11條
-        # 注意：正確法律名稱是「性別平等工作法」（不是「性別工作平等法」）
-        if is_pregnancy_discrimination:
-            # 檢查多種可能的法律名稱
-            gender_equality_law_names = ["性別平等工作法", "性別工作平等法"]
-            found_gender_law = False
+        for law_name, article_no in suggested_pairs:
+            result_id = (law_name, article_no)
             
-            for law_name in gender_equality_law_names:
-                result_id = f"{law_name}_11"
-                
-                # 檢查是否已在 LLM 建議中
-                if (law_name, "11") in llm_suggested_set:
-                    print(f"[MultiPath]   ℹ️ 性平法第11條已在 LLM 建議中，跳過自動補充")
-                    found_gender_law = True
-                    break
-                
-                # 檢查是否已在檢索結果中
-                if result_id in seen_ids:
-                    print(f"[MultiPath]   ℹ️ 性平法第11條已在檢索結果中，跳過自動補充")
-                    found_gender_law = True
-                    break
+            if result_id not in seen_ids:
+                article_data = article_futures[(law_name, article_no)].result()
                 
-                # 嘗試查找
-                article_data = find_article(law_name, "11")
                 if article_data:
                     seen_ids.add(result_id)
                     all_results.append({
                         "law_name": law_name,
                         "law_id": law_name,
-                        "article_no": "11",
-                        "heading": article_data.get("heading", "第 11 條"),
+                        "article_no": article_no,
+                        "heading": article_data.get("heading", f"第 {article_no} 條"),
                         "text": article_data.get("text", ""),
                         "source_file": article_data.get("law_file", ""),
                         "chapter": "",
-                        "score": 1.2,  # 稍高分數（自動補充）
-                        "source": "path3_auto_supplemented"
+                        "score": 1.0,  # 高分數（LLM 直接建議）
+                        "source": "path3_llm_suggested"
                     })
                     forced_count += 1
-                    print(f"[MultiPath]   ✓ 自動補充: {law_name} 第 11 條（懷孕歧視關鍵條文）")
-                    found_gender_law = True
-                    break
-                else:
-                    print(f"[MultiPath]   ⚠️ find_article 找不到: {law_name} 第 11 條")
-            
-            if not found_gender_law:
-                print(f"[MultiPath]   ⚠️ 無法自動補充性平法第11條（所有嘗試都失敗）")
+                    print(f"[MultiPath]   ✓ 強制檢索: {law_name} 第 {article_no} 條")
         
-        # 2. 請假問題：自動補充勞工請假規則第2條
-        if is_leave and ("勞工請假規則", "2") not in llm_suggested_set:
-            result_id = "勞工請假規則_2"
-            if result_id not in seen_ids:
-                article_data = find_article("勞工請假規則", "2")
+        # Phase 2.6.1: 自動補充關鍵法條（如果 LLM 沒有建議）
+        for rule in supplement_rules:
+            for law_name, article_no in rule["targets"]:
+                result_id = (law_name, article_no)
+                # 已在 LLM 建議或檢索結果中：不需補充
+                if result_id in llm_suggested_set or result_id in seen_ids:
+                    print(f"[MultiPath]   ℹ️ {law_name} 第 {article_no} 條已存在，跳過自動補充")
+                    break
+                article_data = article_futures[result_id].result()
                 if article_data:
                     seen_ids.add(result_id)
                     all_results.append({
-                        "law_name": "勞工請假規則",
-                        "law_id": "勞工請假規則",
-                        "article_no": "2",
-                        "heading": article_data.get("heading", "第 2 條"),
+                        "law_name": law_name,
+                        "law_id": law_name,
+                        "article_no": article_no,
+                        "heading": article_data.get("heading", f"第 {article_no} 條"),
                         "text": article_data.get("text", ""),
                         "source_file": article_data.get("law_file", ""),
                         "chapter": "",
-                        "score": 1.2,  # 稍高分數（自動補充）
+                        "score": rule["score"],  # 稍高分數（自動補充）
                         "source": "path3_auto_supplemented"
                     })
                     forced_count += 1
-                    print(f"[MultiPath]   ✓ 自動補充: 勞工請假規則 第 2 條（請假規定關鍵條文）")
+                    print(f"[MultiPath]   ✓ 自動補充: {law_name} 第 {article_no} 條（{rule['label']}）")
+                    break
+                print(f"[MultiPath]   ⚠️ find_article 找不到: {law_name} 第 {article_no} 條")
+            else:
+                print(f"[MultiPath]   ⚠️ 無法自動補充{rule['label']}（所有候選皆找不到）")
         
         print(f"[MultiPath]   ✓ 路徑3 檢索到 {forced_count} 條法條（含自動補充）")
         
@@ -541,17 +702,10 @@ def multi_path_retrieval(
     try:
         print(f"[MultiPath] 路徑4: 原始重寫查詢檢索")
         
-        path4_results = hybrid_search_func(
-            rewritten_query,
-            top_k=top_k,
-            use_rerank=use_rerank,
-            preferred_laws=query_plan.required_laws,
-            blocked_laws=None,
-            prior_articles=None
-        )
+        path4_results = path4_future.result()
         
         for score, metadata in path4_results:
-            result_id = f"{metadata.get('law_id', '')}_{metadata.get('article_no', '')}"
+            result_id = _result_key(metadata.get("law_id"), metadata.get("article_no"))
             if result_id not in seen_ids:
                 seen_ids.add(result_id)
                 all_results.append({
@@ -579,6 +733,11 @@ def multi_path_retrieval(
     return final_results
 
 
+# 法律名稱 + "第" + 數字 + "條"
+_ARTICLE_RE = re.compile(r"(.+?)第\s*(\d+(?:-\d+)?)\s*條")
+
+
+@lru_cache(maxsize=512)
 def _parse_article_string(article_str: str) -> tuple[Optional[str], Optional[str]]:
     """
     解析法條字串（例如："勞動基準法第16條" → ("勞動基準法", "16")）
@@ -589,10 +748,7 @@ def _parse_article_string(article_str: str) -> tuple[Optional[str], Optional[str
     Returns:
         (law_name, article_no): 法律名稱與條號
     """
-    import re
-    
-    # 正則匹配：法律名稱 + "第" + 數字 + "條"
-    match = re.match(r"(.+?)第\s*(\d+(?:-\d+)?)\s*條", article_str)
+    match = _ARTICLE_RE.match(article_str)
     
     if match:
         law_name = match.group(1).strip()
@@ -602,6 +758,11 @@ def _parse_article_string(article_str: str) -> tuple[Optional[str], Optional[str
     return None, None
 
 
+# 性平法兩種可能的法律名稱；加班問題中降權的資遣條文
+_GENDER_EQUALITY_LAWS = frozenset(["性別平等工作法", "性別工作平等法"])
+_SEVERANCE_ARTICLES = frozenset(["16", "17"])
+
+
 def _merge_and_rank_results(results: List[Dict], query_plan: QueryPlan) -> List[Dict]:
     """
     融合並排序多路徑檢索結果（Phase 2.6.1 優化版）
@@ -629,7 +790,7 @@ def _merge_and_rank_results(results: List[Dict], query_plan: QueryPlan) -> List[
                 llm_suggested_articles.add((law_name, article_no.strip()))
     
     # 識別核心法律（用於過濾不相關法條）
-    core_laws = set(query_plan.required_laws)
+    core_laws = frozenset(query_plan.required_laws)
     
     # 識別問題類型（用於過濾不相關法條）
     main_issue_lower = query_plan.main_issue.lower()
@@ -666,7 +827,7 @@ def _merge_and_rank_results(results: List[Dict], query_plan: QueryPlan) -> List[
             priority *= 1.5  # 額外加權 50%
             # 特別加強性平法第11條（懷孕歧視關鍵條文）
             # 注意：支援兩種可能的法律名稱
-            if (law_name in ["性別平等工作法", "性別工作平等法"]) and article_no == "11":
+            if law_name in _GENDER_EQUALITY_LAWS and article_no == "11":
                 priority *= 1.3  # 再額外加權 30%
         
         # Phase 2.6.1 優化：對不相關法條降權（減少交叉汙染）
@@ -677,7 +838,7 @@ def _merge_and_rank_results(results: List[Dict], query_plan: QueryPlan) -> List[
         elif is_termination and law_name == "勞動基準法" and article_no == "11":
             priority *= 0.3  # 大幅降權
         # 如果問題是「加班」，降權「資遣」相關條文（第16、17條）
-        elif is_overtime and law_name == "勞動基準法" and article_no in ["16", "17"]:
+        elif is_overtime and law_name == "勞動基準法" and article_no in _SEVERANCE_ARTICLES:
             priority *= 0.3  # 大幅降權
         # 如果問題不是「加班」，降權「加班費」相關條文（第24條）
         elif not is_overtime and law_name == "勞動基準法" and article_no == "24":
@@ -692,7 +853,5 @@ def _merge_and_rank_results(results: List[Dict], query_plan: QueryPlan) -> List[
         result["final_score"] = base_score * priority
     
     # 按最終分數排序
-    sorted_results = sorted(results, key=lambda x: x.get("final_score", 0.0), reverse=True)
-    
-    return sorted_results
+    return sorted(results, key=itemgetter("final_score"), reverse=True)
 
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import re
+from functools import lru_cache
 
 
 RULES = [
@@ -24,8 +25,18 @@ RULES = [
 ]
 
 
+# 所有規則合併為單一交替式，一次掃描完成替換；同一位置依 RULES 順序優先（具體場景在前）
+_ALT_RE = re.compile(
+    "|".join(f"(?P<g{i}>{pat.pattern})" for i, (pat, _) in enumerate(RULES)),
+    re.IGNORECASE,
+)
+_REPLACEMENTS = [rep for _, rep in RULES]
+
+
+def _replace(m: re.Match) -> str:
+    return _REPLACEMENTS[int(m.lastgroup[1:])]
+
+
+@lru_cache(maxsize=2048)
 def rewrite(q: str) -> str:
-    s = q.strip()
-    for pat, rep in RULES:
-        s = pat.sub(rep, s)
-    return s
+    return _ALT_RE.sub(_replace, q.strip())
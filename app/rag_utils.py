@@ -2,10 +2,24 @@ from __future__ import annotations
 
 import json
 import math
+import re
+from collections import Counter
 from dataclasses import dataclass
 from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    from scipy import sparse
+except ImportError:  # pragma: no cover - optional speedup
+    sparse = None
 
 ROOT = Path(__file__).resolve().parents[1]
 INDEX_PATH = ROOT / "data" / "index" / "index.json"
@@ -24,64 +38,124 @@ def is_cjk(ch: str) -> bool:
     )
 
 
+_ASCII_TOKEN_RE = re.compile(r"[a-z0-9]{2,}")
+
+
 def tokenize(text: str):
-    import re
+    """ASCII words (len >= 2) plus CJK unigrams and bigrams of consecutive CJK characters.
 
+    Bigrams pair neighbours in the CJK-only sequence, i.e. they bridge over non-CJK text.
+    """
     text = text.lower()
-    ascii_tokens = re.findall(r"[a-z0-9]+", text)
-    ascii_tokens = [t for t in ascii_tokens if len(t) >= 2]
-    cjk_seq = [ch for ch in text if is_cjk(ch)]
-    cjk_unigrams = cjk_seq
-    cjk_bigrams = [cjk_seq[i] + cjk_seq[i + 1] for i in range(len(cjk_seq) - 1)]
-    return ascii_tokens + cjk_unigrams + cjk_bigrams
+    tokens = _ASCII_TOKEN_RE.findall(text)
+    prev = None
+    for ch in text:
+        # Common CJK block first; is_cjk covers the rarer extension ranges
+        if "\u4e00" <= ch <= "\u9fff" or is_cjk(ch):
+            tokens.append(ch)
+            if prev is not None:
+                tokens.append(prev + ch)
+            prev = ch
+    return tokens
 
 
 @lru_cache(maxsize=1)
 def load_index() -> Dict:
     if not INDEX_PATH.exists():
         raise FileNotFoundError(f"Index not found: {INDEX_PATH}")
+    if orjson is not None:
+        return orjson.loads(INDEX_PATH.read_bytes())
     with open(INDEX_PATH, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
+@dataclass(frozen=True)
+class _TfidfIndex:
+    idf: Dict[str, float]
+    term_ids: Dict[str, int]
+    # (num_docs, num_terms) CSR of tf*idf weights when SciPy is installed
+    matrix: Optional[object]
+    # term -> (doc indices, tf*idf weights); fallback when SciPy is missing
+    postings: Dict[str, Tuple[np.ndarray, np.ndarray]]
+    doc_norm: np.ndarray
+    docs: List[Dict]
+
+
 @lru_cache(maxsize=1)
-def _precompute() -> Tuple[Dict, Dict, float, List[Dict]]:
-    """Return (idf, doc_norm, q_norm_default, docs)."""
+def _precompute() -> _TfidfIndex:
+    """Build the weighted document-term layout once per process.
+
+    Scoring a query only touches the documents that contain its terms, either via
+    one sparse matrix-vector product or via the per-term postings.
+    """
     index = load_index()
     docs = index["docs"]
     N = index["meta"]["num_docs"]
     idf = {t: math.log((N + 1) / (df + 1)) + 1.0 for t, df in index["meta"]["df"].items()}
-    doc_norm = {}
-    for d in docs:
+    rows: Dict[str, Tuple[List[int], List[float]]] = {}
+    doc_norm = np.ones(len(docs))
+    for i, d in enumerate(docs):
         s = 0.0
         for t, c in d["tf"].items():
             w = c * idf.get(t, 0.0)
             s += w * w
-        doc_norm[d["id"]] = math.sqrt(s) if s > 0 else 1.0
-    return idf, doc_norm, 1.0, docs
+            ids, weights = rows.setdefault(t, ([], []))
+            ids.append(i)
+            weights.append(w)
+        if s > 0:
+            doc_norm[i] = math.sqrt(s)
+    postings = {
+        t: (np.asarray(ids, dtype=np.int32), np.asarray(weights, dtype=np.float64))
+        for t, (ids, weights) in rows.items()
+    }
+    term_ids = {t: j for j, t in enumerate(postings)}
+
+    matrix = None
+    if sparse is not None:
+        # Postings are the matrix columns: assemble CSC directly, then convert for row-wise matvec
+        indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(ids) for ids, _ in postings.values()])
+        if postings:
+            indices = np.concatenate([ids for ids, _ in postings.values()])
+            data = np.concatenate([weights for _, weights in postings.values()])
+        else:
+            indices = np.zeros(0, dtype=np.int32)
+            data = np.zeros(0)
+        matrix = sparse.csc_matrix((data, indices, indptr), shape=(len(docs), len(postings))).tocsr()
+        postings = {}
+    return _TfidfIndex(idf, term_ids, matrix, postings, doc_norm, docs)
 
 
 def search(query: str, top_k: int = 5) -> List[Tuple[float, Dict]]:
-    idf, doc_norm, q_norm_default, docs = _precompute()
+    tfidf = _precompute()
+    if top_k <= 0:
+        return []
 
     # Query vector
-    q_tf: Dict[str, int] = {}
-    for t in tokenize(query):
-        q_tf[t] = q_tf.get(t, 0) + 1
-    q_weights = {t: c * idf.get(t, 0.0) for t, c in q_tf.items()}
-    q_norm = math.sqrt(sum(w * w for w in q_weights.values())) or q_norm_default
-
-    # Score
-    scores: List[Tuple[float, Dict]] = []
-    for d in docs:
-        dot = 0.0
-        tf = d["tf"]
-        for t, qw in q_weights.items():
-            if t in tf:
-                dot += qw * (tf[t] * idf.get(t, 0.0))
-        sim = dot / (q_norm * doc_norm[d["id"]]) if dot > 0 else 0.0
-        if sim > 0:
-            scores.append((sim, d))
-    scores.sort(key=lambda x: x[0], reverse=True)
-    return scores[:top_k]
+    idf = tfidf.idf
+    q_weights = {t: c * idf.get(t, 0.0) for t, c in Counter(tokenize(query)).items()}
+    q_norm = float(np.linalg.norm(np.fromiter(q_weights.values(), dtype=np.float64, count=len(q_weights)))) or 1.0
 
+    # Score: dot products restricted to the query terms
+    if tfidf.matrix is not None:
+        q = np.zeros(tfidf.matrix.shape[1])
+        for t, qw in q_weights.items():
+            j = tfidf.term_ids.get(t)
+            if j is not None:
+                q[j] = qw
+        scores = tfidf.matrix @ q
+    else:
+        scores = np.zeros(len(tfidf.docs))
+        for t, qw in q_weights.items():
+            hit = tfidf.postings.get(t)
+            if hit is not None and qw:
+                ids, weights = hit
+                scores[ids] += qw * weights
+    scores /= q_norm * tfidf.doc_norm
+
+    # Stable sort over the nonzero candidates: ties (including at the k-th place) keep
+    # document order, like the previous list sort
+    cand = np.flatnonzero(scores > 0)
+    cand = cand[np.argsort(-scores[cand], kind="stable")][:top_k]
+    docs = tfidf.docs
+    return [(float(scores[i]), docs[i]) for i in cand]
@@ -15,6 +15,10 @@ Reranker Module - 二次排序模組
 
 from typing import List, Dict, Tuple, Optional
 from pathlib import Path
+import contextlib
+import importlib.util
+import os
+import threading
 import time
 
 try:
@@ -24,10 +28,31 @@ except ImportError:
     RERANKER_AVAILABLE = False
     FlagReranker = None
 
+try:
+    import torch
+except ImportError:  # pragma: no cover - FlagEmbedding 未安裝時
+    torch = None
+
 ROOT = Path(__file__).resolve().parents[1]
 
+# 設為 1/true 時於載入後套用 INT8 動態量化（需先驗證量化後的排序品質）
+RERANKER_INT8 = os.environ.get("RERANKER_INT8", "").strip().lower() in ("1", "true", "yes")
+
+# 動態批次：依 (query, passage) 字元長度排序後打包，每批「最長長度 × 筆數」不超過此預算
+MAX_BATCH_TOKENS = 16384
+
 # 全局實例緩存（避免重複載入模型）
 _RERANKER_INSTANCE: Optional['Reranker'] = None
+_RERANKER_LOCK = threading.Lock()
+# 模型載入完成後才設定；未就緒前檢索端略過重排序，不讓請求等待載入
+_RERANKER_READY = threading.Event()
+_WARMUP_THREAD: Optional[threading.Thread] = None
+# 背景載入失敗時記錄錯誤，視為不可用（檢索端不再等待重排序，結果可正常快取）
+_LOAD_ERROR: Optional[Exception] = None
+
+# 已安裝 hf_transfer 時使用較快的模型下載（未安裝時設定此變數會讓下載失敗）
+if importlib.util.find_spec("hf_transfer") is not None:
+    os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
 
 
 class Reranker:
@@ -47,7 +72,8 @@ class Reranker:
         self,
         model_name: str = "BAAI/bge-reranker-v2-m3",
         use_fp16: bool = True,
-        device: Optional[str] = None
+        device: Optional[str] = None,
+        quantize_int8: Optional[bool] = None
     ):
         """
         初始化 Reranker
@@ -56,15 +82,21 @@ class Reranker:
             model_name: Reranker 模型名稱
             use_fp16: 是否使用 FP16 加速（需 GPU）
             device: 指定設備（'cpu', 'cuda', 'cuda:0' 等）
+            quantize_int8: 是否將 Linear 層動態量化為 INT8（預設依環境變數 RERANKER_INT8，未設定則不量化）
         """
         if not RERANKER_AVAILABLE:
             raise RuntimeError(
                 "FlagEmbedding 未安裝。請執行：pip install FlagEmbedding"
             )
         
+        if quantize_int8 is None:
+            quantize_int8 = RERANKER_INT8
+        
         self.model_name = model_name
-        self.use_fp16 = use_fp16
+        # INT8 量化需從 FP32 權重開始
+        self.use_fp16 = use_fp16 and not quantize_int8
         self.device = device
+        self.quantized = False
         
         # 載入模型
         print(f"[Reranker] 載入模型：{model_name}")
@@ -73,15 +105,39 @@ class Reranker:
         try:
             self.model = FlagReranker(
                 model_name,
-                use_fp16=use_fp16,
+                use_fp16=self.use_fp16,
                 device=device
             )
+            if quantize_int8:
+                self.quantized = self._quantize_int8()
+            if torch is not None and torch.cuda.is_available():
+                torch.backends.cuda.matmul.allow_tf32 = True
             load_time = time.time() - start_time
             print(f"[Reranker] 模型載入完成，耗時 {load_time:.2f} 秒")
         except Exception as e:
             print(f"[Reranker] 模型載入失敗：{e}")
             raise
     
+    def _quantize_int8(self) -> bool:
+        """
+        CPU 推論加速：Linear 層權重轉為 INT8，啟動值於執行時動態量化
+        
+        Returns:
+            是否量化成功（失敗時保留原模型）
+        """
+        model = getattr(self.model, "model", None)
+        if torch is None or model is None:
+            return False
+        try:
+            self.model.model = torch.quantization.quantize_dynamic(
+                model.float(), {torch.nn.Linear}, dtype=torch.qint8
+            )
+        except Exception as e:
+            print(f"[Reranker] INT8 量化失敗，改用原模型：{e}")
+            return False
+        print("[Reranker] 已套用 INT8 動態量化")
+        return True
+    
     def rerank(
         self,
         query: str,
@@ -119,17 +175,9 @@ class Reranker:
         # 批次計算相關性分數
         try:
             start_time = time.time()
-            scores = self.model.compute_score(
-                pairs,
-                normalize=True,
-                batch_size=batch_size
-            )
+            scores = self._score_pairs(pairs, batch_size)
             inference_time = time.time() - start_time
             
-            # 確保 scores 是列表
-            if not isinstance(scores, list):
-                scores = scores.tolist() if hasattr(scores, 'tolist') else [scores]
-            
             # 將分數加入候選字典
             for i, candidate in enumerate(candidates):
                 candidate['rerank_score'] = float(scores[i])
@@ -151,6 +199,45 @@ class Reranker:
             # 降級處理：返回原始候選
             return candidates[:top_k]
     
+    def _score_pairs(self, pairs: List[List[str]], batch_size: int) -> List[float]:
+        """
+        依長度分桶的動態批次打分：短段落可多筆一批，長段落自動縮小批次
+        
+        Args:
+            pairs: (query, passage) 對
+            batch_size: 每批最多筆數
+        
+        Returns:
+            與 pairs 同順序的相關性分數（0-1）
+        """
+        order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+        batches: List[List[int]] = []
+        current: List[int] = []
+        for i in order:
+            # 已依長度遞增排序，目前這筆即為批次內最長
+            length = len(pairs[i][0]) + len(pairs[i][1])
+            if current and (len(current) >= batch_size or length * (len(current) + 1) > MAX_BATCH_TOKENS):
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        
+        scores = [0.0] * len(pairs)
+        inference = torch.inference_mode() if torch is not None else contextlib.nullcontext()
+        with inference:
+            for batch in batches:
+                batch_scores = self.model.compute_score(
+                    [pairs[i] for i in batch],
+                    normalize=True,
+                    batch_size=len(batch)
+                )
+                if not isinstance(batch_scores, list):
+                    batch_scores = batch_scores.tolist() if hasattr(batch_scores, 'tolist') else [batch_scores]
+                for i, score in zip(batch, batch_scores):
+                    scores[i] = float(score)
+        return scores
+    
     def compute_scores(
         self,
         query: str,
@@ -174,16 +261,7 @@ class Reranker:
         pairs = [[query, p] for p in passages]
         
         try:
-            scores = self.model.compute_score(
-                pairs,
-                normalize=True,
-                batch_size=batch_size
-            )
-            
-            if not isinstance(scores, list):
-                scores = scores.tolist() if hasattr(scores, 'tolist') else [scores]
-            
-            return [float(s) for s in scores]
+            return self._score_pairs(pairs, batch_size)
         
         except Exception as e:
             print(f"[Reranker] 計算分數失敗：{e}")
@@ -203,12 +281,47 @@ def get_reranker(model_name: str = "BAAI/bge-reranker-v2-m3") -> Reranker:
     global _RERANKER_INSTANCE
     
     if _RERANKER_INSTANCE is None:
-        _RERANKER_INSTANCE = Reranker(model_name=model_name)
+        with _RERANKER_LOCK:
+            if _RERANKER_INSTANCE is None:
+                _RERANKER_INSTANCE = Reranker(model_name=model_name)
+                _RERANKER_READY.set()
     
     return _RERANKER_INSTANCE
 
 
+def start_warmup(model_name: str = "BAAI/bge-reranker-v2-m3") -> None:
+    """
+    於背景執行緒載入模型（重複呼叫無副作用），服務啟動不必等待下載與載入
+    
+    Args:
+        model_name: 模型名稱
+    """
+    global _WARMUP_THREAD
+    
+    if not is_available() or _RERANKER_READY.is_set():
+        return
+    with _RERANKER_LOCK:
+        if _WARMUP_THREAD is not None:
+            return
+        
+        def _load():
+            global _LOAD_ERROR
+            try:
+                get_reranker(model_name)
+            except Exception as e:
+                _LOAD_ERROR = e
+                print(f"[Reranker] 背景載入失敗，停用重排序：{e}")
+        
+        _WARMUP_THREAD = threading.Thread(target=_load, name="reranker-warmup", daemon=True)
+        _WARMUP_THREAD.start()
+
+
+def is_ready() -> bool:
+    """模型是否已載入完成"""
+    return _RERANKER_READY.is_set()
+
+
 def is_available() -> bool:
-    """檢查 Reranker 是否可用"""
-    return RERANKER_AVAILABLE
+    """檢查 Reranker 是否可用（未安裝或背景載入失敗時為 False）"""
+    return RERANKER_AVAILABLE and _LOAD_ERROR is None
 
@@ -2,19 +2,37 @@ from __future__ import annotations
 
 
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Dict, List, Tuple, Optional
 
 import re
+import threading
+import time
 
 
 
 # 🆕 Phase 1: Use centralized reranker module
-from .reranker import get_reranker as _get_reranker_instance, is_available as reranker_available
+from .reranker import (
+    get_reranker as _get_reranker_instance,
+    is_available as reranker_available,
+    is_ready as reranker_ready,
+    start_warmup as reranker_warmup,
+)
 
 def _get_reranker():
-    """Get reranker instance (backward compatible wrapper)"""
+    """Get reranker instance (backward compatible wrapper).
+
+    Returns None while the model is still loading in the background, so requests skip
+    reranking instead of blocking on the load.
+    """
     if not reranker_available():
         return None
+    if not reranker_ready():
+        reranker_warmup()
+        print("[Retrieval] Reranker still loading, skipping rerank")
+        return None
     try:
         return _get_reranker_instance()
     except Exception as e:
@@ -27,11 +45,13 @@ def _get_reranker():
 
 from .rag_utils import search as tfidf_search
 
-from .vector_store import is_available as vector_available, search as vector_search
+from .vector_store import is_available as vector_available, search as vector_search, search_many as vector_search_many
 
 from .heading_index import get_heading_index
 
-from .law_guides import LawGuideEngine
+from .keyword_matcher import KeywordMatcher
+
+from .law_guides import LawGuideEngine, get_engine
 
 
 _GUIDE_ENGINE: Optional[LawGuideEngine] = None
@@ -47,7 +67,7 @@ def _get_guide_engine() -> Optional[LawGuideEngine]:
 
     try:
 
-        _GUIDE_ENGINE = LawGuideEngine()
+        _GUIDE_ENGINE = get_engine()
 
     except Exception:
 
@@ -56,23 +76,32 @@ def _get_guide_engine() -> Optional[LawGuideEngine]:
     return _GUIDE_ENGINE
 
 
+# Query-preprocessing patterns, compiled once
+_ARTICLE_NO_RE = re.compile(r"\u7B2C\s*([\u4E00-\u9FFF0-9]+)\s*\u689D")  # 第…條
+_ARTICLE_DIGITS_RE = re.compile(r"([0-9]{1,3})\s*\u689D")  # 16條
+_ARTICLE_PREFIX_RE = re.compile(r"\u7B2C\s*([0-9]{1,3})")  # 第16
+_CHAPTER_RE = re.compile(r"\u7B2C\s*([\u4E00-\u9FFF0-9]+)\s*\u7AE0")  # 第…章
+_KEYWORD_RE = re.compile(r"[\u4e00-\u9fff]{2,}")
+
+
+@lru_cache(maxsize=1024)
 def _extract_article_no(q: str) -> str | None:
 
     q = q.strip()
 
-    m = re.search(r"\u7B2C\s*([\u4E00-\u9FFF0-9]+)\s*\u689D", q)
+    m = _ARTICLE_NO_RE.search(q)
 
     if m:
 
         return m.group(1)
 
-    m = re.search(r"([0-9]{1,3})\s*\u689D", q)
+    m = _ARTICLE_DIGITS_RE.search(q)
 
     if m:
 
         return m.group(1)
 
-    m = re.search(r"\u7B2C\s*([0-9]{1,3})", q)
+    m = _ARTICLE_PREFIX_RE.search(q)
 
     if m:
 
@@ -81,16 +110,18 @@ def _extract_article_no(q: str) -> str | None:
     return None
 
 
+@lru_cache(maxsize=1024)
 def _extract_chapter_token(q: str) -> str | None:
 
-    m = re.search(r"\u7B2C\s*([\u4E00-\u9FFF0-9]+)\s*\u7AE0", q.strip())
+    m = _CHAPTER_RE.search(q.strip())
 
     return m.group(0) if m else None
 
 
-def _extract_keywords(q: str, max_tokens: int = 3) -> List[str]:
+@lru_cache(maxsize=1024)
+def _extract_keywords(q: str, max_tokens: int = 3) -> Tuple[str, ...]:
 
-    tokens = re.findall(r"[\u4e00-\u9fff]{2,}", q)
+    tokens = _KEYWORD_RE.findall(q)
 
     uniq: List[str] = []
 
@@ -104,9 +135,45 @@ def _extract_keywords(q: str, max_tokens: int = 3) -> List[str]:
 
             break
 
-    return uniq
+    return tuple(uniq)
+
+
+
+@lru_cache(maxsize=256)
+def _keyword_matcher(
+    preferred: Tuple[str, ...] = (),
+    blocked: Tuple[str, ...] = (),
+    required: Tuple[str, ...] = (),
+) -> KeywordMatcher:
+    """Aho-Corasick matcher for one combination of law filters / required phrases (built once per combination)."""
+    return KeywordMatcher({"preferred": preferred, "blocked": blocked, "required": required})
+
 
 
+# 跨請求共用：不同問題的子查詢（如「資遣 預告期」）經常重複
+HYBRID_CACHE_SIZE = 4096
+HYBRID_CACHE_TTL = 3600.0  # 秒
+
+# key -> (寫入時間, 結果)
+_HYBRID_CACHE: "OrderedDict[tuple, Tuple[float, List[Tuple[float, Dict]]]]" = OrderedDict()
+_HYBRID_CACHE_LOCK = threading.Lock()
+
+# 批次查詢在取得向量結果後，各查詢的詞彙評分/重排序並行執行
+_BATCH_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid-batch")
+
+_HYBRID_DEFAULTS = dict(
+    top_k=5,
+    w_vec=0.6,
+    w_lex=0.4,
+    use_rerank=False,
+    rerank_top_k=20,
+    preferred_laws=None,
+    blocked_laws=None,
+    required_phrases=None,
+    prior_articles=None,
+    strict_whitelist=False,
+)
+
 
 def hybrid_search(
     query: str,
@@ -121,6 +188,120 @@ def hybrid_search(
     prior_articles: Optional[List[str]] = None,
     strict_whitelist: bool = False,
 ) -> List[Tuple[float, Dict]]:
+    """Hybrid TF-IDF + vector search, memoized per argument set (LRU with TTL, HYBRID_CACHE_SIZE entries).
+
+    Callers receive a fresh list; the (score, meta) rows are shared and must be treated as read-only.
+    """
+    options = dict(
+        top_k=top_k,
+        w_vec=w_vec,
+        w_lex=w_lex,
+        use_rerank=use_rerank,
+        rerank_top_k=rerank_top_k,
+        preferred_laws=preferred_laws,
+        blocked_laws=blocked_laws,
+        required_phrases=required_phrases,
+        prior_articles=prior_articles,
+        strict_whitelist=strict_whitelist,
+    )
+    key = _hybrid_cache_key(query, options)
+    cached = _hybrid_cache_get(key)
+    if cached is not None:
+        return cached
+
+    items, complete = _hybrid_search(query, **options)
+    if complete:
+        _hybrid_cache_put(key, items)
+    return list(items)
+
+
+def hybrid_search_batch(queries: List[str], **options) -> List[List[Tuple[float, Dict]]]:
+    """hybrid_search for several queries sharing the same options.
+
+    Vector hits for all uncached queries come from one batched embedding request instead of
+    one per query; the lexical scoring then runs per query on a small thread pool. Results are in ``queries`` order.
+    """
+    options = {**_HYBRID_DEFAULTS, **options}
+    keys = [_hybrid_cache_key(q, options) for q in queries]
+    results: List[Optional[List[Tuple[float, Dict]]]] = [_hybrid_cache_get(k) for k in keys]
+    pending = [i for i, r in enumerate(results) if r is None]
+    if not pending:
+        return results
+
+    vector_hits: List[Optional[List[Tuple[float, Dict]]]] = [None] * len(pending)
+    if vector_available():
+        try:
+            vector_hits = vector_search_many(
+                [queries[i] for i in pending], top_k=max(10, options["top_k"])
+            )
+        except Exception as exc:
+            print(f"[Retrieval] Batched vector search failed, falling back per query: {exc}")
+
+    futures = [
+        _BATCH_POOL.submit(_hybrid_search, queries[i], _vector_hits=hits, **options)
+        for i, hits in zip(pending, vector_hits)
+    ]
+    for i, fut in zip(pending, futures):
+        items, complete = fut.result()
+        if complete:
+            _hybrid_cache_put(keys[i], items)
+        results[i] = list(items)
+    return results
+
+
+def clear_hybrid_cache() -> None:
+    """Drop memoized hybrid_search results (call after rebuilding the index or law files)."""
+    with _HYBRID_CACHE_LOCK:
+        _HYBRID_CACHE.clear()
+
+
+def _hybrid_cache_key(query: str, options: Dict) -> tuple:
+    # Law lists stay ordered: preferred_laws[0] is the fallback target for forced articles
+    return (
+        " ".join(query.split()), options["top_k"], options["w_vec"], options["w_lex"],
+        options["use_rerank"], options["rerank_top_k"],
+        tuple(options["preferred_laws"] or ()), tuple(options["blocked_laws"] or ()),
+        tuple(options["required_phrases"] or ()), tuple(options["prior_articles"] or ()),
+        options["strict_whitelist"],
+    )
+
+
+def _hybrid_cache_get(key: tuple) -> Optional[List[Tuple[float, Dict]]]:
+    with _HYBRID_CACHE_LOCK:
+        cached = _HYBRID_CACHE.get(key)
+        if cached is None:
+            return None
+        if time.monotonic() - cached[0] > HYBRID_CACHE_TTL:
+            del _HYBRID_CACHE[key]
+            return None
+        _HYBRID_CACHE.move_to_end(key)
+        return list(cached[1])
+
+
+def _hybrid_cache_put(key: tuple, items: List[Tuple[float, Dict]]) -> None:
+    with _HYBRID_CACHE_LOCK:
+        _HYBRID_CACHE[key] = (time.monotonic(), items)
+        _HYBRID_CACHE.move_to_end(key)
+        while len(_HYBRID_CACHE) > HYBRID_CACHE_SIZE:
+            _HYBRID_CACHE.popitem(last=False)
+
+
+def _hybrid_search(
+    query: str,
+    top_k: int,
+    w_vec: float,
+    w_lex: float,
+    use_rerank: bool,
+    rerank_top_k: int,
+    preferred_laws: Optional[List[str]],
+    blocked_laws: Optional[List[str]],
+    required_phrases: Optional[List[str]],
+    prior_articles: Optional[List[str]],
+    strict_whitelist: bool,
+    _vector_hits: Optional[List[Tuple[float, Dict]]] = None,
+) -> Tuple[List[Tuple[float, Dict]], bool]:
+    """Returns (items, complete); complete is False when reranking was requested but did not run,
+    e.g. the model is still loading or rerank() failed, so callers must not memoize the items."""
     # Gather candidates
     cand: Dict[str, Dict] = {}
     score_map = {}
@@ -174,8 +355,10 @@ def hybrid_search(
             if definition_priority_articles:
                 print(f"[Retrieval] Definition-priority articles: {definition_priority_articles}")
 
-    if vector_available():
-        for s, d in vector_search(query, top_k=max(10, top_k)):
+    if _vector_hits is None and vector_available():
+        _vector_hits = vector_search(query, top_k=max(10, top_k))
+    if _vector_hits:
+        for s, d in _vector_hits:
             cand[d["id"]] = d
             score_map.setdefault(d["id"], 0.0)
             score_map[d["id"]] += w_vec * float(s)
@@ -210,12 +393,21 @@ def hybrid_search(
     art = article_hint
     chap_tok = _extract_chapter_token(query)
     items: List[Tuple[float, Dict]] = []
+    # One automaton scan per candidate instead of a substring test per (candidate, law/phrase)
+    law_matcher = _keyword_matcher(
+        preferred=tuple(preferred_laws or ()), blocked=tuple(blocked_laws or ())
+    ) if (preferred_laws or blocked_laws) else None
+    required_matcher = _keyword_matcher(required=tuple(required_phrases)) if required_phrases else None
+    # An empty phrase matches every text, as with the plain `in` test
+    required_always = bool(required_phrases) and "" in required_phrases
     # Optional required phrases filter helper
     def _has_required(d: Dict) -> bool:
-        if not required_phrases:
+        if required_matcher is None or required_always:
             return True
         txt = (d.get("text") or "") + "\n" + (d.get("heading") or "")
-        return any(rp in txt for rp in required_phrases)
+        return "required" in required_matcher.scan(txt)
+    # Civil law penalty applies unless the user explicitly asked for civil law
+    civil_law_asked = any(kw in query for kw in ["民法", "債編", "僱傭", "債務", "侵權"])
     keys = list(score_map.keys())
     for i in keys:
         s = score_map[i]
@@ -223,9 +415,10 @@ def hybrid_search(
         law_id = d.get("law_id") or ""
         src = (d.get("source_file") or "")
         title = d.get("title") or ""
+        law_hits = law_matcher.scan(law_id + "\n" + src + "\n" + title) if law_matcher else {}
         # Strict whitelist: drop non-preferred entirely
         if strict_whitelist and preferred_laws:
-            if not any((p and (p in law_id or p in src or p in title)) for p in preferred_laws):
+            if "preferred" not in law_hits:
                 continue
         if art and d.get("heading") and art in d.get("heading", ""):
             s += 0.15
@@ -236,22 +429,12 @@ def hybrid_search(
             s -= 0.5
         # Apply law-level preferences
         # Blocked laws: strong penalty
-        if blocked_laws:
-            for b in blocked_laws:
-                if not b:
-                    continue
-                if (b in law_id) or (b in src) or (b in title):
-                    s -= 1e6
+        blocked_hits = law_hits.get("blocked")
+        if blocked_hits:
+            s -= 1e6 * sum(1 for b in blocked_laws if b in blocked_hits)
         # Preferred laws: boost preferred, mild penalty for others
         if preferred_laws:
-            matched_pref = False
-            for p in preferred_laws:
-                if not p:
-                    continue
-                if (p in law_id) or (p in src) or (p in title):
-                    matched_pref = True
-                    break
-            if matched_pref:
+            if "preferred" in law_hits:
                 s += 0.20
             else:
                 s -= 0.05
@@ -269,10 +452,8 @@ def hybrid_search(
                 s += 0.30  # Strong boost for definition articles
         
         # Civil law penalty (unless explicitly mentioned in query)
-        if "民法" in law_id or "民法" in title:
-            # Only penalize if user didn't explicitly ask for civil law
-            if not any(kw in query for kw in ["民法", "債編", "僱傭", "債務", "侵權"]):
-                s -= 0.5  # Significant penalty to prioritize labor laws
+        if not civil_law_asked and ("民法" in law_id or "民法" in title):
+            s -= 0.5  # Significant penalty to prioritize labor laws
         items.append((s, d))
     items.sort(key=lambda x: x[0], reverse=True)
 
@@ -347,9 +528,13 @@ def hybrid_search(
                     print(f"[Retrieval] Force-retrieved article: {target_law} 第{missing_art}條")
 
     # 🆕 Phase 1: Enhanced Reranker integration
+    complete = True
     if use_rerank:
         reranker = _get_reranker()
-        if reranker is not None:
+        if reranker is None:
+            # Not installed (or failed to load) is final; still loading is not
+            complete = not reranker_available()
+        else:
             pool = items[: max(rerank_top_k, top_k)]
             # Convert to dict format expected by reranker.rerank()
             candidates = [{"text": d.get("text", ""), "original_score": s, **d} for s, d in pool]
@@ -364,10 +549,13 @@ def hybrid_search(
                 )
                 # Convert back to (score, dict) format
                 items = [(c.get('rerank_score', 0), c) for c in reranked_candidates]
+                # rerank() falls back to the input order without scores when inference fails
+                complete = all("rerank_score" in c for c in reranked_candidates)
             except Exception as e:
                 print(f"[Retrieval] Reranker failed, using original scores: {e}")
                 # Fallback to original ranking
                 items = pool
+                complete = False
 
-    return items[:top_k]
+    return items[:top_k], complete
 
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import List, Optional
 
 
@@ -74,6 +75,7 @@ RULESET: List[TopicRule] = [
 ]
 
 
+@lru_cache(maxsize=2048)
 def resolve_topic(q_norm: str) -> Optional[TopicRule]:
     s = q_norm.strip()
     # Simple heuristic matching by required phrases
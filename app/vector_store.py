@@ -1,5 +1,7 @@
 ﻿from __future__ import annotations
 
+import os
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 
@@ -34,6 +36,7 @@ def _get_collection():
 _HF_CACHE: Dict[str, object] = {}
 
 
+@lru_cache(maxsize=1)
 def _read_api_key() -> Optional[str]:
     path = (ROOT / "api key.txt")
     if not path.exists():
@@ -65,19 +68,19 @@ def _format_query_for_model(query: str, model_name: Optional[str]) -> str:
     return query
 
 
-def _ensure_query_embedding(query: str, col) -> List[float]:
+def _embed_queries(queries: List[str], col) -> List[List[float]]:
+    """Embed several queries with one backend call (one OpenAI request / one encode batch)."""
     meta = getattr(col, "metadata", None) or {}
     backend = meta.get("backend")
     model_name = meta.get("model_name")
-    n_results = 1
     if backend == "openai":
         from openai import OpenAI
         key = _read_api_key()
         if not key:
             raise RuntimeError("找不到 OpenAI 金鑰，無法使用向量檢索（openai 後端）。")
         client = OpenAI(api_key=key)
-        resp = client.embeddings.create(model=model_name or "text-embedding-3-small", input=[query])
-        return resp.data[0].embedding
+        resp = client.embeddings.create(model=model_name or "text-embedding-3-small", input=list(queries))
+        return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
     else:
         # default to HF/Flag local model if not specified
         model_name = model_name or "BAAI/bge-large-zh-v1.5"
@@ -87,9 +90,36 @@ def _ensure_query_embedding(query: str, col) -> List[float]:
         if key not in _HF_CACHE:
             _HF_CACHE[key] = SentenceTransformer(model_name)
         model = _HF_CACHE[key]
-        text = _format_query_for_model(query, model_name)
-        vec = model.encode([text], normalize_embeddings=True)[0]
-        return vec.tolist() if hasattr(vec, "tolist") else list(vec)
+        texts = [_format_query_for_model(q, model_name) for q in queries]
+        vecs = model.encode(texts, normalize_embeddings=True)
+        return [v.tolist() if hasattr(v, "tolist") else list(v) for v in vecs]
+
+
+def prefetch() -> int:
+    """Ask the kernel to read the Chroma index files into page cache ahead of the first search.
+
+    Uses posix_fadvise(WILLNEED), which starts readahead asynchronously; a no-op where unsupported.
+    Returns the number of bytes advised.
+    """
+    fadvise = getattr(os, "posix_fadvise", None)
+    if fadvise is None or not CHROMA_DIR.exists():
+        return 0
+    total = 0
+    for path in CHROMA_DIR.rglob("*"):
+        if not path.is_file():
+            continue
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            total += os.fstat(fd).st_size
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    return total
 
 
 def warmup() -> Dict[str, Optional[str]]:
@@ -120,23 +150,35 @@ def warmup() -> Dict[str, Optional[str]]:
 
 
 def search(query: str, top_k: int = 5) -> List[Tuple[float, Dict]]:
+    return search_many([query], top_k=top_k)[0]
+
+
+def search_many(queries: List[str], top_k: int = 5) -> List[List[Tuple[float, Dict]]]:
+    """Vector search for several queries: one embedding call and one Chroma query for the batch."""
+    if not queries:
+        return []
     col = _get_collection()
+    n_results = max(1, min(20, top_k))
     try:
         # Prefer explicit query embeddings to avoid relying on server-side functions
-        qvec = _ensure_query_embedding(query, col)
-        res = col.query(query_embeddings=[qvec], n_results=max(1, min(20, top_k)))
+        qvecs = _embed_queries(queries, col)
+        res = col.query(query_embeddings=qvecs, n_results=n_results)
     except Exception:
         # Fallback to query_texts if embedding function is configured
-        res = col.query(query_texts=[query], n_results=max(1, min(20, top_k)))
+        res = col.query(query_texts=list(queries), n_results=n_results)
+    return [_rows(res, qi) for qi in range(len(queries))]
+
+
+def _rows(res: Dict, qi: int) -> List[Tuple[float, Dict]]:
     out: List[Tuple[float, Dict]] = []
-    ids = res.get("ids", [[]])[0]
-    docs = res.get("documents", [[]])[0]
-    metas = res.get("metadatas", [[]])[0]
+    ids = (res.get("ids") or [[]])[qi]
+    docs = (res.get("documents") or [[]])[qi]
+    metas = (res.get("metadatas") or [[]])[qi]
     dists = res.get("distances") or res.get("embeddings")  # distances for cosine
     scores = []
-    if dists and isinstance(dists, list) and dists and isinstance(dists[0], list):
+    if dists and isinstance(dists, list) and dists and isinstance(dists[qi], list):
         # For cosine, smaller distance -> higher similarity. Convert to similarity score.
-        distances = dists[0]
+        distances = dists[qi]
         # Normalize to similarity ~ 1 - distance (rough)
         scores = [1.0 - float(d) for d in distances]
     else:
@@ -43,10 +43,11 @@ def tokenize(text: str):
 
 ARTICLE_HEAD_RE = re.compile(r"^\u7B2C.{0,12}\u689D", re.MULTILINE)  # 第…條
 CHAPTER_HEAD_RE = re.compile(r"^\u7B2C.{0,8}\u7AE0", re.MULTILINE)  # 第…章
+ARTICLE_NO_RE = re.compile(r"^\u7B2C\s*(.+?)\s*\u689D")  # heading -> article number
 
 
 def extract_article_no(heading: str) -> str:
-    m = re.match(r"^\u7B2C\s*(.+?)\s*\u689D", heading.strip())
+    m = ARTICLE_NO_RE.match(heading.strip())
     return m.group(1) if m else ""
 
 